@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Compares the throughput of the JSON API with the HTML routes.
+
+The benchmark seeds a separate database in the instance folder, then requests
+the feed and comments of the same user through both the HTML routes and the
+JSON API using the Flask test client. The database is removed afterwards.
+
+To run the benchmark enter 'poetry run python benchmarks/api_vs_html.py' in a terminal.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from social_insecurity import create_app, sqlite  # noqa: E402
+from social_insecurity.config import Config  # noqa: E402
+
+
+class BenchmarkConfig(Config):
+    SQLITE3_DATABASE_PATH = "benchmark.db"
+    WTF_CSRF_ENABLED = False
+
+
+def seed(posts: int, comments: int) -> int:
+    """Seeds the benchmark database and returns the id of the post with comments."""
+    for username in ("bench", "friend"):
+        sqlite.query(
+            "INSERT INTO Users (username, first_name, last_name, password) VALUES (?, 'Bench', 'Mark', 'x');",
+            username,
+        )
+    user_id = sqlite.query("SELECT id FROM Users WHERE username = 'bench';", one=True)["id"]
+    friend_id = sqlite.query("SELECT id FROM Users WHERE username = 'friend';", one=True)["id"]
+    connection = sqlite.connection
+    connection.execute("INSERT INTO Friends (u_id, f_id) VALUES (?, ?);", (user_id, friend_id))
+    connection.executemany(
+        "INSERT INTO Posts (u_id, content, image, creation_time) VALUES (?, ?, '', datetime('now', ?));",
+        [(user_id if i % 2 else friend_id, f"post {i}", f"-{i} seconds") for i in range(posts)],
+    )
+    post_id = connection.execute("SELECT MAX(id) FROM Posts;").fetchone()[0]
+    connection.executemany(
+        "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, ?, ?, datetime('now', ?));",
+        [(post_id, friend_id, f"comment {i}", f"-{i} seconds") for i in range(comments)],
+    )
+    connection.commit()
+    return post_id
+
+
+def measure(client, url: str, requests: int) -> float:
+    """Returns the throughput of a GET endpoint in requests per second.
+
+    The body is read in full, since a streamed page is only rendered while it is read.
+    """
+    client.get(url).get_data()
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        assert response.status_code == 200, (url, response.status_code)
+    return requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    database = Path(app.instance_path) / BenchmarkConfig.SQLITE3_DATABASE_PATH
+    try:
+        with app.app_context():
+            post_id = seed(args.posts, args.comments)
+        client = app.test_client()
+        cases = [
+            ("feed", "/stream/bench", "/api/v1/feed/bench?limit=100"),
+            ("comments", f"/comments/bench/{post_id}", f"/api/v1/posts/{post_id}?limit=100"),
+        ]
+        print(f"{'endpoint':<10} {'html req/s':>12} {'api req/s':>12} {'speedup':>8}")
+        for name, html_url, api_url in cases:
+            html = measure(client, html_url, args.requests)
+            api = measure(client, api_url, args.requests)
+            print(f"{name:<10} {html:>12.1f} {api:>12.1f} {api / html:>7.1f}x")
+    finally:
+        for path in (database, database.with_name(database.name + "-wal"), database.with_name(database.name + "-shm")):
+            path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
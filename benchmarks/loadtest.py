@@ -0,0 +1,556 @@
+#!/usr/bin/env python
+
+"""Load tests the application under a multi-process WSGI server and reports its capacity.
+
+The load test seeds a separate database in a temporary folder, starts the
+application under gunicorn if it is installed, otherwise under the Werkzeug
+server with one forked process per request, and lets many virtual users
+replay a mix of logins, feed views, posts, comments and friend requests over
+plain HTTP. Every virtual user is a thread with its own keep-alive connection
+and session cookie, and runs its actions back to back, or with a random think
+time in between.
+
+The report lists the throughput, the latency percentiles and the errors per
+action, and the number of SQLite lock timeouts found in the server log. It
+then estimates which resource saturates first:
+
+    server CPU:      The CPU time of all server processes, per available core.
+    bcrypt:          The logins, times the measured cost of a password check.
+    connections:     The requests, times the measured cost of opening a database connection.
+    SQLite lock:     The writes, times the measured cost of a write transaction, on a single writer lock.
+    load generator:  The CPU time of this process, which must not be the bottleneck itself.
+
+CSRF protection is turned off, and rate limiting too unless --rate-limit is
+given, because all virtual users share one IP address.
+
+To run the load test enter 'poetry run python benchmarks/loadtest.py --workers 4 --users 50' in a terminal.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlencode
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from flask_bcrypt import Bcrypt  # noqa: E402
+
+from social_insecurity import create_app, sqlite  # noqa: E402
+
+SERVER = r"""
+import json, sys
+from werkzeug.serving import run_simple
+from social_insecurity import create_app
+app = create_app(json.loads(sys.argv[1]))
+run_simple("127.0.0.1", int(sys.argv[2]), app, processes=int(sys.argv[3]), threaded=False)
+"""
+
+# The default mix of actions, as relative weights.
+MIX = {
+    "feed": 40,
+    "comments": 15,
+    "comment": 10,
+    "profile": 8,
+    "friends": 8,
+    "login": 5,
+    "post": 5,
+    "add_friend": 4,
+}
+WRITES = {"login", "post", "comment", "add_friend"}
+PASSWORD = "loadtest"
+WORDS = "the quick brown fox jumps over a lazy dog while we all wait for the database".split()
+# The smallest valid PNG image, one transparent pixel.
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082"
+)
+LOCK_ERRORS = (b"database is locked", b"database table is locked")
+
+
+@dataclass
+class Result:
+    """The requests of one action type."""
+
+    latencies: list[float] = field(default_factory=list)  # Seconds
+    statuses: dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    failures: int = 0  # Requests without a response
+
+
+class VirtualUser:
+    """A client with its own connection and session cookie, replaying a random mix of actions."""
+
+    def __init__(self, port: int, username: str, usernames: list[str], posts: int, rng: random.Random) -> None:
+        self.port = port
+        self.username = username
+        self.usernames = usernames
+        self.posts = posts
+        self.rng = rng
+        self.cookies: dict[str, str] = {}
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def request(self, method: str, path: str, body: bytes = b"", content_type: Optional[str] = None) -> int:
+        """Sends a request, reads the whole response and returns its status code."""
+        headers = {"Connection": "keep-alive"}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        if content_type:
+            headers["Content-Type"] = content_type
+        try:
+            self.connection.request(method, path, body=body or None, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+        for header in response.headers.get_all("Set-Cookie") or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel["max-age"] == "0" or not morsel.value:
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response.status
+
+    def form(self, path: str, data: dict[str, str]) -> int:
+        return self.request("POST", path, urlencode(data).encode(), "application/x-www-form-urlencoded")
+
+    def sentence(self) -> str:
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 12)))
+
+    def act(self, action: str) -> int:
+        """Performs an action and returns the status code of its request."""
+        me = self.username
+        if action == "login":
+            return self.form(
+                "/", {"login-username": me, "login-password": PASSWORD, "login-submit": "Sign In"}
+            )
+        if action == "feed":
+            return self.request("GET", f"/stream/{me}")
+        if action == "post":
+            boundary = secrets.token_hex(16)
+            name = f"{me}{secrets.token_hex(4)}.png"
+            body = (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="content"\r\n\r\n{self.sentence()}\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="submit"\r\n\r\nPost\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+                f"Content-Type: image/png\r\n\r\n"
+            ).encode() + PNG + f"\r\n--{boundary}--\r\n".encode()
+            return self.request("POST", f"/stream/{me}", body, f"multipart/form-data; boundary={boundary}")
+        post_id = self.rng.randint(1, self.posts)
+        if action == "comments":
+            return self.request("GET", f"/comments/{me}/{post_id}")
+        if action == "comment":
+            return self.form(f"/comments/{me}/{post_id}", {"comment": self.sentence(), "submit": "Comment"})
+        if action == "friends":
+            return self.request("GET", f"/friends/{me}")
+        if action == "add_friend":
+            return self.form(f"/friends/{me}", {"username": self.rng.choice(self.usernames), "submit": "Add Friend"})
+        if action == "profile":
+            return self.request("GET", f"/profile/{me}")
+        raise ValueError(f"Unknown action: {action}")
+
+
+def letters(number: int) -> str:
+    """Returns a name made of letters only, because the forms reject digits in usernames."""
+    name = ""
+    for _ in range(3):
+        number, rest = divmod(number, 26)
+        name = chr(ord("a") + rest) + name
+    return name
+
+
+def seed(config: dict[str, Any], users: int, friends: int, posts: int, comments: int, rng: random.Random) -> int:
+    """Seeds the load test database and returns the number of posts."""
+    app = create_app(config)
+    password = Bcrypt(app).generate_password_hash(PASSWORD, rounds=config["BCRYPT_LOG_ROUNDS"]).decode("utf-8")
+    usernames = [f"vu{letters(i)}" for i in range(users)]
+    with app.app_context():
+        connection = sqlite.connection
+        connection.executemany(
+            "INSERT INTO Users (username, first_name, last_name, password) VALUES (?, 'Virtual', 'User', ?);",
+            [(username, password) for username in usernames],
+        )
+        ids = [row[0] for row in connection.execute("SELECT id FROM Users WHERE username LIKE 'vu%' ORDER BY id;")]
+        connection.executemany(
+            "INSERT OR IGNORE INTO Friends (u_id, f_id) VALUES (?, ?);",
+            [(user_id, friend_id) for user_id in ids for friend_id in rng.sample(ids, min(friends, len(ids)))],
+        )
+        connection.executemany(
+            "INSERT INTO Posts (u_id, content, image, creation_time) VALUES (?, ?, '', datetime('now', ?));",
+            [(rng.choice(ids), " ".join(rng.choices(WORDS, k=8)), f"-{i} minutes") for i in range(posts)],
+        )
+        total = connection.execute("SELECT MAX(id) FROM Posts;").fetchone()[0]
+        connection.executemany(
+            "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, ?, ?, datetime('now', ?));",
+            [
+                (rng.randint(1, total), rng.choice(ids), " ".join(rng.choices(WORDS, k=6)), f"-{i} seconds")
+                for i in range(comments)
+            ],
+        )
+        connection.commit()
+    return total
+
+
+def start_server(kind: str, config: dict[str, Any], port: int, workers: int, log: Path) -> subprocess.Popen:
+    """Starts the application in a server process that logs to a file."""
+    if kind == "gunicorn":
+        command = [
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{port}",
+            "--timeout", "120",
+            f"social_insecurity:create_app({config!r})",
+        ]
+    else:
+        command = [sys.executable, "-c", SERVER, json.dumps(config), str(port), str(workers)]
+    with log.open("wb") as output:
+        server = subprocess.Popen(command, cwd=ROOT, stdout=output, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited, see {log}:\n{log.read_text()[-2000:]}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The server did not start within 60 seconds.")
+
+
+def process_tree_cpu(pid: int) -> Optional[float]:
+    """Returns the CPU seconds used by a process, its live descendants and their reaped children.
+
+    Works on Linux only, returns None elsewhere.
+    """
+    proc = Path("/proc")
+    if not proc.exists():
+        return None
+    children: dict[int, list[int]] = defaultdict(list)
+    times: dict[int, int] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces, the fields after it are space separated.
+        fields = stat[stat.rindex(")") + 2 :].split()
+        children[int(fields[1])].append(int(entry.name))
+        # utime, stime, cutime and cstime, in clock ticks.
+        times[int(entry.name)] = sum(int(value) for value in fields[11:15])
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += times.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def write_cost(repeat: int = 20) -> float:
+    """Returns the median duration of a comment insert transaction in seconds, and removes the comments again."""
+    connection = sqlite.connect()
+    try:
+        cost = median_time(
+            lambda: connection.execute(
+                "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (1, 1, 'probe', CURRENT_TIMESTAMP);"
+            ) and connection.commit(),
+            repeat,
+        )
+        connection.execute("DELETE FROM Comments WHERE comment = 'probe';")
+        connection.commit()
+    finally:
+        connection.close()
+    return cost
+
+
+def median_time(function, repeat: int) -> float:
+    """Returns the median duration of a function call in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    """Returns the nearest-rank percentile of sorted latencies."""
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, max(0, round(p / 100 * len(latencies)) - 1))]
+
+
+def run_users(
+    port: int,
+    usernames: list[str],
+    users: int,
+    posts: int,
+    duration: float,
+    think_time: float,
+    mix: dict[str, int],
+    rng_seed: int,
+) -> dict[str, Result]:
+    """Runs the virtual users until the duration has passed and returns the results per action."""
+    results: dict[str, Result] = defaultdict(Result)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    actions, weights = zip(*mix.items())
+
+    def record(action: str, latency: float, status: Optional[int]) -> None:
+        with lock:
+            result = results[action]
+            result.latencies.append(latency)
+            if status is None:
+                result.failures += 1
+            else:
+                result.statuses[status] += 1
+
+    def virtual_user(number: int) -> None:
+        rng = random.Random(rng_seed + number)
+        user = VirtualUser(port, usernames[number % len(usernames)], usernames, posts, rng)
+        action = "login"
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status: Optional[int] = user.act(action)
+            except (OSError, http.client.HTTPException):
+                status = None
+            record(action, time.perf_counter() - start, status)
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+            action = rng.choices(actions, weights)[0]
+
+    threads = [threading.Thread(target=virtual_user, args=(number,), daemon=True) for number in range(users)]
+    for thread in threads:
+        thread.start()
+        # Spread the logins of the first second.
+        time.sleep(min(1.0 / users, 0.05))
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(
+    args: argparse.Namespace,
+    kind: str,
+    results: dict[str, Result],
+    elapsed: float,
+    server_cpu: Optional[float],
+    client_cpu: float,
+    lock_timeouts: int,
+    bcrypt_cost: float,
+    connect_cost: float,
+    commit_cost: float,
+) -> dict[str, Any]:
+    """Prints the capacity report and returns it as a dictionary."""
+    print(f"Server: {kind} with {args.workers} worker processes, {os.cpu_count()} CPU cores")
+    print(f"Load: {args.users} virtual users for {elapsed:.1f} s, think time {args.think_time} s")
+    print()
+    columns = ["requests", "req/s", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"]
+    print(f"{'action':<12}" + "".join(f"{column:>10}" for column in columns))
+    summary: dict[str, Any] = {"actions": {}}
+    everything = Result()
+    for action in sorted(results, key=lambda action: -len(results[action].latencies)) + ["total"]:
+        if action == "total":
+            result = everything
+        else:
+            result = results[action]
+            everything.latencies.extend(result.latencies)
+            everything.failures += result.failures
+            for status, count in result.statuses.items():
+                everything.statuses[status] += count
+        latencies = sorted(result.latencies)
+        errors = result.failures + sum(count for status, count in result.statuses.items() if status >= 400)
+        row = {
+            "requests": len(latencies),
+            "rps": len(latencies) / elapsed,
+            "errors": errors,
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+            "statuses": dict(result.statuses),
+        }
+        summary["actions"][action] = row
+        print(
+            f"{action:<12}{row['requests']:>10}{row['rps']:>10.1f}{row['errors']:>10}"
+            f"{row['p50']:>10.1f}{row['p90']:>10.1f}{row['p99']:>10.1f}{row['max']:>10.1f}"
+        )
+
+    total = summary["actions"]["total"]
+    requests = max(total["requests"], 1)
+    server_errors = sum(count for status, count in everything.statuses.items() if status >= 500)
+    client_errors = sum(count for status, count in everything.statuses.items() if 400 <= status < 500)
+    print()
+    print(
+        f"Errors: {total['errors'] / requests:.2%} of requests "
+        f"({server_errors} 5xx, {client_errors} 4xx, {everything.failures} without response)"
+    )
+    print(f"Lock timeouts: {lock_timeouts} ({lock_timeouts / requests:.2%} of requests)")
+
+    # Estimate how busy every resource was during the run.
+    cores = min(os.cpu_count() or 1, args.workers)
+    logins = summary["actions"].get("login", {}).get("requests", 0)
+    reads = sorted(latency for action, result in results.items() if action not in WRITES for latency in result.latencies)
+    writes = sorted(latency for action, result in results.items() if action in WRITES for latency in result.latencies)
+    write_ratio = percentile(writes, 90) / max(percentile(reads, 90), 1e-6)
+    resources: dict[str, dict[str, Any]] = {
+        "server CPU": {
+            "utilization": server_cpu / (elapsed * cores) if server_cpu is not None else None,
+            "detail": f"{server_cpu:.1f} s CPU on {cores} cores" if server_cpu is not None else "not measurable",
+        },
+        "bcrypt": {
+            "utilization": logins * bcrypt_cost / (elapsed * cores),
+            "detail": f"{logins} logins x {bcrypt_cost * 1000:.0f} ms",
+        },
+        "connections": {
+            "utilization": requests * connect_cost / (elapsed * cores),
+            "detail": f"{requests} connections x {connect_cost * 1000:.2f} ms",
+        },
+        "SQLite lock": {
+            # There is a single writer at a time, no matter how many cores there are.
+            "utilization": len(writes) * commit_cost / elapsed,
+            "detail": (
+                f"{len(writes)} writes x {commit_cost * 1000:.2f} ms, "
+                f"write p90 is {write_ratio:.1f}x read p90, {lock_timeouts} timeouts"
+            ),
+        },
+        "load generator": {
+            "utilization": client_cpu / elapsed,
+            "detail": f"{client_cpu:.1f} s CPU on one core (GIL)",
+        },
+    }
+    print()
+    print(f"{'resource':<16}{'busy':>8}  detail")
+    for name, resource in resources.items():
+        utilization = resource["utilization"]
+        busy = f"{utilization:.0%}" if utilization is not None else "n/a"
+        print(f"{name:<16}{busy:>8}  {resource['detail']}")
+
+    print()
+    if resources["load generator"]["utilization"] > 0.9:
+        verdict = "The load generator is saturated, run it on another machine or with fewer users."
+    elif lock_timeouts or resources["SQLite lock"]["utilization"] > 0.8:
+        verdict = "SQLite lock: writers queue for the database lock before the CPU is used up."
+    elif (resources["server CPU"]["utilization"] or 0) > 0.8:
+        cpu = server_cpu or 1e-6
+        if logins * bcrypt_cost / cpu > 0.5:
+            verdict = "bcrypt CPU: password checks use most of the server CPU time."
+        elif requests * connect_cost / cpu > 0.2:
+            verdict = "Connection setup: opening database connections uses a large share of the server CPU time."
+        else:
+            verdict = "Server CPU: request handling (queries and templates) uses up the CPU."
+    else:
+        verdict = "Nothing is saturated yet, increase --users or lower --think-time."
+    print(f"Saturates first: {verdict}")
+    summary.update({"resources": resources, "verdict": verdict, "lock_timeouts": lock_timeouts, "elapsed": elapsed})
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["auto", "gunicorn", "werkzeug"], default="auto")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--users", type=int, default=32, help="Number of virtual users.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run the load.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between actions of a user.")
+    parser.add_argument("--accounts", type=int, default=200, help="Number of seeded users.")
+    parser.add_argument("--friends", type=int, default=10, help="Number of friends per seeded user.")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=10000)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--rate-limit", action="store_true", help="Keep login rate limiting enabled.")
+    parser.add_argument("--mix", type=json.loads, default=MIX, help="Action weights as JSON.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    kind = args.server
+    if kind == "auto":
+        try:
+            import gunicorn  # noqa: F401  # pylint: disable=import-outside-toplevel,unused-import
+            kind = "gunicorn"
+        except ImportError:
+            kind = "werkzeug"
+
+    with tempfile.TemporaryDirectory() as directory:
+        folder = Path(directory)
+        config = {
+            "SECRET_KEY": secrets.token_hex(),
+            "SQLITE3_DATABASE_PATH": str(folder / "loadtest.db"),
+            "UPLOADS_FOLDER_PATH": str(folder / "uploads"),
+            "JINJA_BYTECODE_CACHE_PATH": str(folder / "jinja_cache"),
+            "WTF_CSRF_ENABLED": False,
+            "BCRYPT_LOG_ROUNDS": args.bcrypt_rounds,
+            "RATELIMIT_ENABLED": args.rate_limit,
+            "RATELIMIT_STORAGE": "sqlite",
+            "RATELIMIT_STORAGE_PATH": str(folder / "ratelimit.db"),
+        }
+        rng = random.Random(args.seed)
+        print(f"Seeding {args.accounts} users, {args.posts} posts and {args.comments} comments ...")
+        posts = seed(config, args.accounts, args.friends, args.posts, args.comments, rng)
+        usernames = [f"vu{letters(i)}" for i in range(args.accounts)]
+
+        # Measure the unit costs the resource estimates are based on.
+        bcrypt = Bcrypt()
+        password_hash = bcrypt.generate_password_hash(PASSWORD, rounds=args.bcrypt_rounds)
+        bcrypt_cost = median_time(lambda: bcrypt.check_password_hash(password_hash, PASSWORD), 3)
+        app = create_app(config)
+        connect_cost = median_time(lambda: sqlite.connect().close(), 200)
+        commit_cost = write_cost()
+        del app
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        log = folder / "server.log"
+        server = start_server(kind, config, port, args.workers, log)
+        try:
+            cpu_before = process_tree_cpu(server.pid)
+            client_before = time.process_time()
+            start = time.monotonic()
+            results = run_users(
+                port, usernames, args.users, posts, args.duration, args.think_time, args.mix, args.seed
+            )
+            elapsed = time.monotonic() - start
+            cpu_after = process_tree_cpu(server.pid)
+            client_cpu = time.process_time() - client_before
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        server_cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+        output = log.read_bytes()
+        lock_timeouts = sum(output.count(error) for error in LOCK_ERRORS)
+
+        print()
+        summary = report(
+            args, kind, results, elapsed, server_cpu, client_cpu, lock_timeouts, bcrypt_cost, connect_cost, commit_cost
+        )
+        if args.json:
+            args.json.write_text(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""Measures the import time, startup time and first request latency of the application.
+
+Every measurement runs in a fresh Python process, so nothing is cached in memory between runs.
+The startup modes are:
+
+    cold:       No template precompilation and no bytecode cache.
+    precompile: Templates are compiled at startup, the bytecode cache is empty.
+    bytecode:   Templates are compiled at startup from a warm bytecode cache.
+    preload:    The application is loaded, then forked, the worker serves the requests.
+
+To run the benchmark enter 'poetry run python benchmarks/startup.py' in a terminal.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+from social_insecurity import create_app
+from social_insecurity.startup import prepare_for_fork
+imported = time.perf_counter()
+app = create_app(json.loads(sys.argv[1]))
+if sys.argv[2] == "preload":
+    prepare_for_fork(app)
+created = time.perf_counter()
+if sys.argv[2] == "preload":
+    read, write = os.pipe()
+    if os.fork():
+        os.close(write)
+        print(os.read(read, 4096).decode())
+        os.wait()
+        sys.exit(0)
+    os.close(read)
+    created = time.perf_counter()
+client = app.test_client()
+timings = {"import": imported - start, "startup": created - imported}
+for name, url in (("index", "/"), ("stream", "/stream/test"), ("comments", "/comments/test/1")):
+    before = time.perf_counter()
+    client.get(url)
+    timings[name] = time.perf_counter() - before
+result = json.dumps(timings)
+if sys.argv[2] == "preload":
+    os.write(write, result.encode())
+    os._exit(0)
+print(result)
+"""
+
+
+def run(mode: str, config: dict) -> dict[str, float]:
+    """Runs one measurement in a fresh process and returns its timings in seconds."""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(config), mode],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = str(Path(directory) / "startup.db")
+        cache = str(Path(directory) / "jinja_cache")
+        modes = {
+            "cold": {"JINJA_BYTECODE_CACHE_PATH": None, "PRECOMPILE_TEMPLATES": False},
+            "precompile": {"JINJA_BYTECODE_CACHE_PATH": None, "PRECOMPILE_TEMPLATES": True},
+            "bytecode": {"JINJA_BYTECODE_CACHE_PATH": cache, "PRECOMPILE_TEMPLATES": True},
+            "preload": {"JINJA_BYTECODE_CACHE_PATH": cache, "PRECOMPILE_TEMPLATES": True},
+        }
+        # Create the database and fill the bytecode cache.
+        run("bytecode", {"SQLITE3_DATABASE_PATH": database, **modes["bytecode"]})
+
+        columns = ["import", "startup", "index", "stream", "comments"]
+        print(f"{'mode':<12}" + "".join(f"{column + ' ms':>14}" for column in columns))
+        for mode, config in modes.items():
+            runs = [run(mode, {"SQLITE3_DATABASE_PATH": database, **config}) for _ in range(args.runs)]
+            medians = [statistics.median(timings[column] for timings in runs) * 1000 for column in columns]
+            print(f"{mode:<12}" + "".join(f"{median:>14.1f}" for median in medians))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,38 @@
 The package contains the Flask application factory.
 """
 
+import sqlite3
+import time
 from pathlib import Path
 from shutil import rmtree
-from typing import cast
+from typing import Optional, TextIO, cast
 
+import click
 from flask import Flask, current_app, Response
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from social_insecurity.backup import create_snapshot, prune_snapshots
+from social_insecurity.conditional import VersionStamps
 from social_insecurity.config import Config
 from social_insecurity.database import SQLite3
+from social_insecurity.maintenance import TASKS, DatabaseMaintenance
+from social_insecurity.pagination import PAGINATION_INDEXES
+from social_insecurity.profile_cache import ProfileCache
+from social_insecurity.ratelimit import RateLimiter
+from social_insecurity.session_store import SessionStore
+from social_insecurity.startup import optimize_startup
+from social_insecurity.transfer import ON_CONFLICT, export_rows, import_rows, restore_deferred
 
 # from flask_login import LoginManager
 from flask_bcrypt import Bcrypt 
 from flask_wtf.csrf import CSRFProtect
 
 sqlite = SQLite3()
+stamps = VersionStamps()
+profiles = ProfileCache()
+maintenance = DatabaseMaintenance()
+limiter = RateLimiter()
+sessions = SessionStore()
 bcrypt = Bcrypt()
 # TODO: Handle login management better, maybe with flask_login?
 # login = LoginManager()
@@ -28,16 +46,26 @@ def create_app(test_config=None) -> Flask:
     """Create and configure the Flask application."""
     app = Flask(__name__)
     app.config.from_object(Config)
-    if test_config:
+    if isinstance(test_config, dict):
+        app.config.from_mapping(test_config)
+    elif test_config:
         app.config.from_object(test_config)
 
+    trust_proxies(app)
     sqlite.init_app(app, schema="schema.sql")
+    sqlite.executescript(PAGINATION_INDEXES)
+    stamps.init_app(app, sqlite)
+    profiles.init_app(app, sqlite)
+    maintenance.init_app(app, sqlite)
+    limiter.init_app(app)
+    sessions.init_app(app, sqlite)
     bcrypt.init_app(app)
     # login.init_app(app)
     csrf.init_app(app)
 
     with app.app_context():
         create_uploads_folder(app)
+    restore_interrupted_import()
 
     @app.cli.command("reset")
     def reset_command() -> None:
@@ -46,6 +74,69 @@ def create_app(test_config=None) -> Flask:
         if instance_path.exists():
             rmtree(instance_path)
 
+    @app.cli.command("maintenance")
+    @click.option("--task", "tasks", multiple=True, type=click.Choice(list(TASKS)), help="Task to run, may be repeated.")
+    @click.option("--budget", type=float, help="Time budget per task in seconds.")
+    @click.option("--checkpoint-mode", type=click.Choice(["passive", "truncate"]), help="Mode of the WAL checkpoint.")
+    def maintenance_command(tasks: tuple[str, ...], budget: Optional[float], checkpoint_mode: Optional[str]) -> None:
+        """Run database maintenance tasks."""
+        maintenance.run(tasks or None, budget=budget, checkpoint_mode=checkpoint_mode)
+
+    @app.cli.command("backup")
+    @click.option("--destination", type=click.Path(file_okay=False, path_type=Path), help="The backup folder.")
+    @click.option("--every", type=float, help="Repeat the backup every given number of seconds.")
+    @click.option("--keep", type=click.IntRange(min=0), help="Number of snapshots to keep.")
+    def backup_command(destination: Optional[Path], every: Optional[float], keep: Optional[int]) -> None:
+        """Back up the database and uploads while the app is running."""
+        instance_path = Path(current_app.instance_path)
+        backup_path = destination or instance_path / current_app.config["BACKUP_FOLDER_PATH"]
+        uploads_path = instance_path / current_app.config["UPLOADS_FOLDER_PATH"]
+        if keep is None:
+            keep = current_app.config["BACKUP_KEEP"]
+        while True:
+            source = sqlite.connect()
+            try:
+                snapshot = create_snapshot(
+                    source,
+                    uploads_path,
+                    backup_path,
+                    pages=current_app.config["BACKUP_PAGES_PER_STEP"],
+                    pause=current_app.config["BACKUP_STEP_PAUSE"],
+                )
+            finally:
+                source.close()
+            pruned = prune_snapshots(backup_path, keep)
+            click.echo(f"Backup: Created snapshot {snapshot}, pruned {pruned} old snapshots.")
+            if not every:
+                break
+            time.sleep(every)
+
+    @app.cli.command("export")
+    @click.argument("output", type=click.File("w"), default="-")
+    @click.option("--batch-size", type=int, default=1000, show_default=True, help="Rows fetched at a time.")
+    def export_command(output: TextIO, batch_size: int) -> None:
+        """Export all user data as NDJSON to OUTPUT, or to stdout."""
+        conn = sqlite.connect()
+        try:
+            output.writelines(export_rows(conn, batch_size=batch_size))
+        finally:
+            conn.close()
+
+    @app.cli.command("import")
+    @click.argument("input_", metavar="INPUT", type=click.File("r"), default="-")
+    @click.option("--batch-size", type=int, default=1000, show_default=True, help="Rows inserted at a time.")
+    @click.option("--on-conflict", type=click.Choice(ON_CONFLICT), default="abort", show_default=True)
+    def import_command(input_: TextIO, batch_size: int, on_conflict: str) -> None:
+        """Import user data as NDJSON from INPUT, or from stdin."""
+        conn = sqlite.connect()
+        try:
+            counts = import_rows(conn, input_, batch_size=batch_size, on_conflict=on_conflict)
+        except (ValueError, sqlite3.Error) as err:
+            raise click.ClickException(str(err)) from err
+        finally:
+            conn.close()
+        click.echo("Import: " + ", ".join(f"{table}={count}" for table, count in counts.items()), err=True)
+
     @app.after_request
     def add_security_headers(response: Response) -> Response:
         response.headers["Content-Security-Policy"] = (
@@ -64,12 +155,36 @@ def create_app(test_config=None) -> Flask:
         return response
     with app.app_context():
         import social_insecurity.routes  # noqa: E402,F401
+        from social_insecurity.api import api
+
+        app.register_blueprint(api)
+
+    optimize_startup(app)
 
     return app
 
 
+def trust_proxies(app: Flask) -> None:
+    """Take the client address from the X-Forwarded-For header set by the trusted reverse proxies."""
+    hops = int(app.config.get("TRUSTED_PROXY_HOPS", 0))
+    # Behind a proxy, remote_addr is the proxy, and the rate limit per client IP address would be shared by everyone.
+    if hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops)
+
+
 def create_uploads_folder(app: Flask) -> None:
     """Create the instance and upload folders."""
     upload_path = Path(app.instance_path) / cast(str, app.config["UPLOADS_FOLDER_PATH"])
-    if not upload_path.exists():
-        upload_path.mkdir(parents=True)
+    # Several worker processes may start at once, so an existing folder is not an error.
+    upload_path.mkdir(parents=True, exist_ok=True)
+
+
+def restore_interrupted_import() -> None:
+    """Recreate the indexes and triggers left dropped by an import that was killed midway."""
+    conn = sqlite.connect()
+    try:
+        restored = restore_deferred(conn)
+    finally:
+        conn.close()
+    if restored:
+        print(f"Import: Restored {restored} indexes and triggers dropped by an interrupted import.")
@@ -0,0 +1,191 @@
+"""Provides the versioned JSON API for the Social Insecurity application.
+
+This file contains the API blueprint. It mirrors the feed, comments, friends
+and profile pages in routes.py, but returns JSON instead of rendered HTML.
+
+The queries follow the ones in routes.py, with two differences. They select
+explicit columns, so password hashes never end up in a response. And they are
+keyset paginated, see pagination.py. Profiles are read through the profile
+cache, see profile_cache.py, whose counters are served under /stats/.
+
+Rows are built as dictionaries directly by the cursor and handed to orjson if
+it is installed, with the standard library json module as a fallback.
+
+Example:
+    GET /api/v1/feed/<username>?limit=20&cursor=<cursor>
+    GET /api/v1/posts/<post_id>?limit=20&cursor=<cursor>
+    GET /api/v1/friends/<username>
+    GET /api/v1/profile/<username>
+    GET /api/v1/stats/profile-cache
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Optional, cast
+
+from flask import Blueprint, Response, g, request
+from flask.ctx import _AppCtxGlobals as ACG  # g type.
+from werkzeug.exceptions import HTTPException, NotFound, Unauthorized
+from werkzeug.local import LocalProxy
+
+from social_insecurity import profiles, sqlite
+from social_insecurity.pagination import (
+    COMMENTS_FIRST_PAGE,
+    COMMENTS_NEXT_PAGE,
+    FEED_FIRST_PAGE,
+    FEED_NEXT_PAGE,
+    decode_cursor,
+    encode_cursor,
+    page_query,
+    parse_limit,
+)
+from social_insecurity.sessions_handler import load_user
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment.
+    orjson = None
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializes an object to compact JSON bytes with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    """Creates a JSON response with a strong ETag and answers conditional GETs.
+
+    The ETag is a digest of the serialized body, so a client that sends a
+    matching If-None-Match header receives an empty 304 response.
+    """
+    body = dumps(obj)
+    response = Response(body, status=status, mimetype="application/json")
+    if status == 200:
+        response.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+        response.make_conditional(request)
+    return response
+
+
+def get_user_id(username: str) -> int:
+    """Returns the id of a user, or raises NotFound if the user does not exist."""
+    get_user = """
+        SELECT id
+        FROM Users
+        WHERE username = ?;
+        """
+    user = sqlite.query(get_user, username, one=True)
+    if user is None:
+        raise NotFound(description=f"No user named {username}.")
+    return cast(int, user["id"])
+
+
+def require_login(username: str) -> None:
+    """Raises Unauthorized unless the session belongs to the given user."""
+    load_user()
+    # pylint: disable=protected-access
+    acg: ACG = cast(LocalProxy[ACG], g)._get_current_object()
+    if acg.user_id is None:
+        raise Unauthorized(description="Not logged in.")
+    if acg.user_username != username:
+        raise Unauthorized(description=(f"Not logged in as {username}."))
+
+
+def page(rows: list[dict[str, Any]], limit: int) -> dict[str, Any]:
+    """Wraps a list of rows, fetched with limit + 1, in a page object."""
+    next_cursor: Optional[str] = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["creation_time"], last["id"])
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+@api.errorhandler(HTTPException)
+def handle_http_exception(error: HTTPException) -> Response:
+    """Returns API errors as JSON instead of HTML."""
+    return json_response({"error": error.description}, status=error.code or 500)
+
+
+@api.route("/feed/<string:username>")
+def feed(username: str) -> Response:
+    """Returns a page of posts from the user and their friends, newest first."""
+    user_id = get_user_id(username)
+    limit = parse_limit(request.args.get("limit"))
+    position = decode_cursor(request.args.get("cursor"))
+    # The first page has no cursor predicate, so the later pages can seek with theirs, see pagination.py.
+    get_posts, parameters = page_query(FEED_FIRST_PAGE, FEED_NEXT_PAGE, position, {"user_id": user_id}, limit + 1)
+    posts = sqlite.query_dicts(get_posts, parameters)
+    return json_response(page(posts, limit))
+
+
+@api.route("/posts/<int:post_id>")
+def post(post_id: int) -> Response:
+    """Returns a post together with a page of its comments, newest first."""
+    limit = parse_limit(request.args.get("limit"))
+    position = decode_cursor(request.args.get("cursor"))
+    get_post = """
+        SELECT p.id, p.content, p.image, p.creation_time, u.username
+        FROM Posts AS p JOIN Users AS u ON p.u_id = u.id
+        WHERE p.id = ?;
+        """
+    post_ = sqlite.query_dicts(get_post, post_id, one=True)
+    if post_ is None:
+        raise NotFound(description=f"No post with id {post_id}.")
+    get_comments, parameters = page_query(
+        COMMENTS_FIRST_PAGE, COMMENTS_NEXT_PAGE, position, {"post_id": post_id}, limit + 1
+    )
+    comments = sqlite.query_dicts(get_comments, parameters)
+    return json_response({"post": post_, "comments": page(comments, limit)})
+
+
+@api.route("/friends/<string:username>")
+def friends(username: str) -> Response:
+    """Returns a page of the user's friends, ordered by user id."""
+    require_login(username)
+    user_id = get_user_id(username)
+    limit = parse_limit(request.args.get("limit"))
+    after = request.args.get("after", default=0, type=int)
+    get_friends = """
+        SELECT u.id, u.username, u.first_name, u.last_name
+        FROM Friends AS f JOIN Users AS u ON f.f_id = u.id
+        WHERE f.u_id = :user_id AND f.f_id != :user_id AND f.f_id > :after
+        ORDER BY f.f_id
+        LIMIT :limit;
+        """
+    rows = sqlite.query_dicts(get_friends, {"user_id": user_id, "after": after, "limit": limit + 1})
+    next_after: Optional[int] = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1]["id"]
+    return json_response({"items": rows, "next_after": next_after})
+
+
+@api.route("/profile/<string:username>")
+def profile(username: str) -> Response:
+    """Returns the user's profile."""
+    require_login(username)
+    # pylint: disable=protected-access
+    acg: ACG = cast(LocalProxy[ACG], g)._get_current_object()
+    user = profiles.get(acg.user_id)
+    if user is None:
+        raise NotFound(description=f"No user named {username}.")
+    return json_response(user)
+
+
+@api.route("/stats/profile-cache")
+def profile_cache_stats() -> Response:
+    """Returns the size and the hit and miss counters of the profile cache in this worker process."""
+    load_user()
+    # pylint: disable=protected-access
+    acg: ACG = cast(LocalProxy[ACG], g)._get_current_object()
+    if acg.user_id is None:
+        raise Unauthorized(description="Not logged in.")
+    response = json_response(profiles.stats())
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,237 @@
+"""Provides online backups for the Social Insecurity application.
+
+The database is copied with the SQLite online backup API, a few pages at a
+time with a short pause between the steps, so readers and writers keep
+working while the backup runs.
+
+The uploads folder is copied into a content addressed object store, where
+every file is stored once under the SHA-256 hash of its content. A snapshot
+only copies the files whose content is not in the store yet, and files whose
+size and modification time did not change since the previous snapshot are
+not even hashed again.
+
+Layout of the backup folder:
+    objects/<hash[:2]>/<hash>     The content of the uploaded files.
+    snapshots/<timestamp>/        One folder per snapshot, containing
+        sqlite3.db                the copy of the database, and
+        manifest.json             the upload file names and their hashes.
+
+Example:
+    from social_insecurity.backup import create_snapshot
+
+    snapshot = create_snapshot(connection, uploads_path, backup_path)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+MANIFEST_NAME = "manifest.json"
+DATABASE_NAME = "sqlite3.db"
+
+
+@dataclass
+class SnapshotResult:
+    """The location and metrics of a finished snapshot."""
+
+    path: Path
+    database_pages: int
+    duration: float  # Seconds
+    uploads: int
+    uploads_copied: int
+    uploads_hashed: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.path.name} in {self.duration:.2f} s "
+            f"(database_pages={self.database_pages}, uploads={self.uploads}, "
+            f"uploads_copied={self.uploads_copied}, uploads_hashed={self.uploads_hashed})"
+        )
+
+
+def backup_database(
+    source: sqlite3.Connection,
+    destination: Path,
+    *,
+    pages: int = 64,
+    pause: float = 0.005,
+) -> int:
+    """Copies a live database to a file, pausing between steps.
+
+    A backup restarts whenever another connection writes to the database. In
+    WAL mode the copy is therefore taken inside a single read transaction,
+    which pins a consistent snapshot without blocking writers. In the other
+    journal modes a read transaction would block writers, so the steps run on
+    their own and writers get through during the pauses.
+
+    The copy is written next to the destination and renamed into place once
+    it is complete, so the destination never holds a torn copy.
+
+    params:
+        source: A connection to the database to copy.
+        destination: The path of the copy.
+        pages: The number of pages to copy per step.
+        pause: The number of seconds to pause between steps.
+
+    returns: The number of pages in the copy.
+
+    """
+    partial = destination.with_name(destination.name + ".partial")
+    partial.unlink(missing_ok=True)
+    total = 0
+
+    def progress(status: int, remaining: int, count: int) -> None:
+        nonlocal total
+        total = count
+        if remaining:
+            time.sleep(pause)
+
+    snapshot = source.execute("PRAGMA journal_mode;").fetchone()[0] == "wal" and not source.in_transaction
+    target = sqlite3.connect(partial)
+    try:
+        if snapshot:
+            source.execute("BEGIN;")
+            source.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        if snapshot:
+            source.rollback()
+        target.close()
+    partial.replace(destination)
+    return total
+
+
+def snapshot_uploads(
+    uploads_path: Path,
+    objects_path: Path,
+    previous: Optional[dict[str, Any]] = None,
+) -> tuple[dict[str, Any], int, int]:
+    """Stores the uploaded files in the object store.
+
+    params:
+        uploads_path: The uploads folder.
+        objects_path: The object store.
+        previous (optional): The uploads section of the previous manifest.
+
+    returns: The uploads section of the new manifest, the number of copied files and the number of hashed files.
+
+    """
+    previous = previous or {}
+    uploads: dict[str, Any] = {}
+    copied = hashed = 0
+    for path in sorted(uploads_path.rglob("*")) if uploads_path.exists() else []:
+        if not path.is_file():
+            continue
+        name = path.relative_to(uploads_path).as_posix()
+        stat = path.stat()
+        entry = previous.get(name)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"sha256": _hash_file(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            hashed += 1
+        uploads[name] = entry
+        obj = objects_path / entry["sha256"][:2] / entry["sha256"]
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            partial = obj.with_name(obj.name + ".partial")
+            shutil.copyfile(path, partial)
+            partial.replace(obj)
+            copied += 1
+    return uploads, copied, hashed
+
+
+def create_snapshot(
+    source: sqlite3.Connection,
+    uploads_path: Path,
+    backup_path: Path,
+    *,
+    pages: int = 64,
+    pause: float = 0.005,
+) -> SnapshotResult:
+    """Creates a snapshot of the database and the uploads folder.
+
+    params:
+        source: A connection to the database to back up.
+        uploads_path: The uploads folder.
+        backup_path: The backup folder.
+        pages: The number of database pages to copy per step.
+        pause: The number of seconds to pause between steps.
+
+    returns: The result of the snapshot.
+
+    """
+    start = time.monotonic()
+    snapshots_path = backup_path / "snapshots"
+    objects_path = backup_path / "objects"
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    partial = snapshots_path / (name + ".partial")
+    partial.mkdir(parents=True)
+
+    path = snapshots_path / name
+    try:
+        previous = list_snapshots(backup_path)
+        previous_uploads = _read_manifest(previous[-1])["uploads"] if previous else None
+        database_pages = backup_database(source, partial / DATABASE_NAME, pages=pages, pause=pause)
+        uploads, copied, hashed = snapshot_uploads(uploads_path, objects_path, previous_uploads)
+        manifest = {"created": name, "database": DATABASE_NAME, "uploads": uploads}
+        (partial / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+        partial.rename(path)
+    except BaseException:
+        # Nothing refers to an unfinished snapshot, and prune_snapshots only sees complete ones.
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    return SnapshotResult(path, database_pages, time.monotonic() - start, len(uploads), copied, hashed)
+
+
+def list_snapshots(backup_path: Path) -> list[Path]:
+    """Returns the complete snapshots, oldest first."""
+    snapshots_path = backup_path / "snapshots"
+    if not snapshots_path.exists():
+        return []
+    return sorted(
+        path
+        for path in snapshots_path.iterdir()
+        if not path.name.endswith(".partial") and (path / MANIFEST_NAME).exists()
+    )
+
+
+def prune_snapshots(backup_path: Path, keep: int) -> int:
+    """Deletes all but the newest snapshots, then the objects no snapshot refers to.
+
+    returns: The number of deleted snapshots.
+
+    """
+    snapshots = list_snapshots(backup_path)
+    deleted = snapshots[: max(len(snapshots) - keep, 0)]
+    for path in deleted:
+        shutil.rmtree(path)
+    referenced = {
+        entry["sha256"] for path in snapshots[len(deleted) :] for entry in _read_manifest(path)["uploads"].values()
+    }
+    objects_path = backup_path / "objects"
+    if objects_path.exists():
+        for obj in objects_path.glob("*/*"):
+            if obj.name not in referenced:
+                obj.unlink()
+    return len(deleted)
+
+
+def _read_manifest(snapshot_path: Path) -> dict[str, Any]:
+    """Reads the manifest of a snapshot."""
+    return json.loads((snapshot_path / MANIFEST_NAME).read_text())
+
+
+def _hash_file(path: Path) -> str:
+    """Returns the SHA-256 hash of the content of a file."""
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,288 @@
+"""Provides conditional GET support for the Social Insecurity application.
+
+The pages of a user or a post are stamped with the counters in the Versions
+table, which are bumped by triggers in schema.sql on every relevant write.
+Reading a stamp is a single indexed lookup, so a route can answer
+If-None-Match with 304 Not Modified before it runs its page queries or
+renders a template.
+
+The pages get an ETag but no Last-Modified header, and If-Modified-Since is
+ignored. A date can not cover everything else a page depends on, i.e. the
+templates, the URL and the CSRF token, and with its one second resolution it
+misses a write made in the same second as the page was sent.
+
+Example:
+    from social_insecurity import stamps
+
+    not_modified = stamps.evaluate(stamps.user(user_id))
+    if not_modified is not None:
+        return not_modified
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from flask import Flask, Response, current_app, g, request, session
+from werkzeug.http import is_resource_modified
+
+from social_insecurity.database import SQLite3
+
+# For databases created before the Versions table and its triggers were added to schema.sql.
+VERSIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS [Versions](
+      scope VARCHAR NOT NULL,
+      [key] INTEGER NOT NULL,
+      counter INTEGER NOT NULL DEFAULT 1,
+      PRIMARY KEY (scope, [key])
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS [Users_insert_version] AFTER INSERT ON [Users]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS [Users_update_version] AFTER UPDATE ON [Users]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    -- Only the profile fields, so the profile cache survives new posts and logins, see profile_cache.py.
+    CREATE TRIGGER IF NOT EXISTS [Users_profile_version]
+    AFTER UPDATE OF username, first_name, last_name, education, employment, music, movie, nationality, birthday
+    ON [Users]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('profile', NEW.id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS [Posts_insert_version] AFTER INSERT ON [Posts]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.u_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS [Posts_delete_version] AFTER DELETE ON [Posts]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', OLD.u_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    -- A comment changes the comment count shown in the feeds of the post author.
+    CREATE TRIGGER IF NOT EXISTS [Comments_insert_version] AFTER INSERT ON [Comments]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('post', NEW.p_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+      INSERT INTO Versions (scope, [key]) SELECT 'user', u_id FROM Posts WHERE id = NEW.p_id
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS [Comments_delete_version] AFTER DELETE ON [Comments]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('post', OLD.p_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+      INSERT INTO Versions (scope, [key]) SELECT 'user', u_id FROM Posts WHERE id = OLD.p_id
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    -- A friendship changes the feeds of both users.
+    CREATE TRIGGER IF NOT EXISTS [Friends_insert_version] AFTER INSERT ON [Friends]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.u_id), ('user', NEW.f_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS [Friends_delete_version] AFTER DELETE ON [Friends]
+    BEGIN
+      INSERT INTO Versions (scope, [key]) VALUES ('user', OLD.u_id), ('user', OLD.f_id)
+      ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+    END;
+    """
+
+
+class VersionStamp(NamedTuple):
+    """The version of the data shown on a page."""
+
+    fingerprint: str
+    # The counter itself, for stamps read from a single row of the Versions table.
+    counter: Optional[int] = None
+
+
+class VersionStamps:
+    """Provides version stamps and conditional GET handling as a Flask extension.
+
+    Example:
+        from flask import Flask
+        from social_insecurity.conditional import VersionStamps
+        from social_insecurity.database import SQLite3
+
+        app = Flask(__name__)
+        sqlite = SQLite3(app)
+        stamps = VersionStamps(app, sqlite)
+    """
+
+    def __init__(self, app: Optional[Flask] = None, sqlite: Optional[SQLite3] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Versions table.
+
+        """
+        if app is not None and sqlite is not None:
+            self.init_app(app, sqlite)
+
+    def init_app(self, app: Flask, sqlite: SQLite3) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Versions table.
+
+        """
+        if "version_stamps" in app.extensions:
+            raise RuntimeError("Flask VersionStamps extension already initialized")
+        app.extensions["version_stamps"] = self
+        self._sqlite = sqlite
+        conn = sqlite.connect()
+        try:
+            _drop_modified_time(conn)
+        finally:
+            conn.close()
+        sqlite.executescript(VERSIONS_SCHEMA)
+        self._salt = _template_salt(app)
+        app.after_request(self._set_headers)
+
+    def user(self, user_id: int) -> Optional[VersionStamp]:
+        """Returns the stamp of the pages that only show data of a single user."""
+        get_version = """
+            SELECT counter
+            FROM Versions
+            WHERE scope = 'user' AND key = ?;
+            """
+        return self._stamp(get_version, user_id)
+
+    def profile(self, user_id: int) -> Optional[VersionStamp]:
+        """Returns the stamp of the pages that only show the profile fields of a user.
+
+        The counter of the stamp can be passed on to profiles.get(), so a cached
+        profile is served without reading the counter a second time.
+        """
+        get_version = """
+            SELECT counter
+            FROM Versions
+            WHERE scope = 'profile' AND key = ?;
+            """
+        return self._stamp(get_version, user_id)
+
+    def circle(self, user_id: int) -> Optional[VersionStamp]:
+        """Returns the stamp of the pages that show data of a user and their friends."""
+        get_version = """
+            SELECT
+              (SELECT counter FROM Versions WHERE scope = 'user' AND key = :user_id)
+              || ':' || COUNT(*) || ':' || TOTAL(counter) AS counter
+            FROM Versions
+            WHERE scope = 'user' AND (
+              key = :user_id
+              OR key IN (SELECT u_id FROM Friends WHERE f_id = :user_id)
+              OR key IN (SELECT f_id FROM Friends WHERE u_id = :user_id));
+            """
+        return self._stamp(get_version, {"user_id": user_id})
+
+    def post(self, post_id: int) -> Optional[VersionStamp]:
+        """Returns the stamp of the pages that show a post and its comments."""
+        get_version = """
+            SELECT counter
+            FROM Versions
+            WHERE scope = 'post' AND key = ?;
+            """
+        return self._stamp(get_version, post_id)
+
+    def evaluate(self, stamp: Optional[VersionStamp]) -> Optional[Response]:
+        """Compares a stamp with the conditional headers of the current request.
+
+        The stamp is remembered, so the response rendered by the route gets an
+        ETag header.
+
+        returns: A 304 Not Modified response if the client's copy is current, otherwise None.
+
+        """
+        if stamp is None or request.method not in ("GET", "HEAD"):
+            return None
+        # Pending flash messages are rendered once, so the page must be sent.
+        if "_flashes" in session:
+            return None
+        etag = self._etag(stamp)
+        g.version_stamp = etag
+        # Without a last_modified date, only If-None-Match can make the resource count as unmodified.
+        if is_resource_modified(request.environ, etag=etag):
+            return None
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    def _stamp(self, query: str, *args) -> Optional[VersionStamp]:
+        """Reads a stamp, or returns None if the database has no Versions table."""
+        try:
+            row = self._sqlite.query(query, *args, one=True)
+        except sqlite3.OperationalError:
+            return None
+        if row is None:
+            return VersionStamp("0", 0)
+        counter = row["counter"] if isinstance(row["counter"], int) else None
+        return VersionStamp(str(row["counter"]), counter)
+
+    def _etag(self, stamp: VersionStamp) -> str:
+        """Combines a stamp with everything else a rendered page depends on."""
+        parts = [self._salt, request.full_path, stamp.fingerprint]
+        if current_app.config.get("WTF_CSRF_ENABLED", True):
+            # The page embeds a CSRF token, which expires after a time limit.
+            parts.append(str(session.get("csrf_token")))
+            time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+            if time_limit:
+                parts.append(str(int(time.time()) // max(time_limit // 2, 1)))
+        return hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _set_headers(self, response: Response) -> Response:
+        """Adds the ETag header to a page stamped by evaluate()."""
+        etag = g.pop("version_stamp", None)
+        if etag is not None and response.status_code == 200:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def _drop_modified_time(conn: sqlite3.Connection) -> None:
+    """Drops the unused modified_time column, and the triggers writing it, from an older Versions table.
+
+    The triggers are then recreated from VERSIONS_SCHEMA. SQLite before 3.35
+    can not drop a column, so there the column and the old triggers are kept.
+    """
+    if "modified_time" not in {row[1] for row in conn.execute("PRAGMA table_info([Versions]);")}:
+        return
+    conn.execute("BEGIN;")
+    try:
+        triggers = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%modified_time%';"
+        ).fetchall()
+        for (name,) in triggers:
+            conn.execute(f"DROP TRIGGER [{name}];")
+        conn.execute("ALTER TABLE [Versions] DROP COLUMN modified_time;")
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+
+
+def _template_salt(app: Flask) -> str:
+    """Returns a digest of the template files, so a deployment invalidates old ETags."""
+    digest = hashlib.blake2b(digest_size=8)
+    if app.template_folder:
+        for path in sorted(Path(app.root_path, app.template_folder).rglob("*")):
+            if path.is_file():
+                digest.update(f"{path.name}:{path.stat().st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
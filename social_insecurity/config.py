@@ -22,8 +22,33 @@ class Config:
     SECRET_KEY = secrets.token_hex()
     SQLITE3_DATABASE_PATH = "sqlite3.db"  # Path relative to the Flask instance folder
     UPLOADS_FOLDER_PATH = "uploads"  # Path relative to the Flask instance folder
+    BACKUP_FOLDER_PATH = "backups"  # Path relative to the Flask instance folder
+    BACKUP_PAGES_PER_STEP = 64  # Database pages copied per backup step
+    BACKUP_STEP_PAUSE = 0.005  # Seconds to pause between backup steps, lets writers through
+    BACKUP_KEEP = 7  # Number of backup snapshots to keep
+    JINJA_BYTECODE_CACHE_PATH = "jinja_cache"  # Path relative to the Flask instance folder, None to disable
+    PRECOMPILE_TEMPLATES = True  # Compile all templates at startup instead of on first use
+    MAINTENANCE_ENABLED = True  # Run database maintenance in the background, disabled when testing
+    MAINTENANCE_INTERVAL = 3600  # Seconds between maintenance runs
+    MAINTENANCE_IDLE_TIME = 30  # Seconds without requests before a maintenance run may start
+    MAINTENANCE_TASK_BUDGET = 1.0  # Seconds each maintenance task may run
+    MAINTENANCE_CHECKPOINT_MODE = "PASSIVE"  # PASSIVE or TRUNCATE
+    RATELIMIT_ENABLED = True  # Throttle login and registration attempts before any password hashing
+    RATELIMIT_STORAGE = "memory"  # memory (per process) or sqlite (shared by all processes on the host)
+    RATELIMIT_STORAGE_PATH = "ratelimit.db"  # Path relative to the Flask instance folder, used by the sqlite storage
+    RATELIMIT_MAX_KEYS = 100_000  # Buckets kept by the memory storage before the least recently used are evicted
+    RATELIMIT_IP_RATE = 0.2  # Attempts per second refilled for each client IP address
+    RATELIMIT_IP_BURST = 10  # Attempts a client IP address may make in a burst
+    RATELIMIT_USERNAME_RATE = 1 / 60  # Failed logins per second refilled for each username
+    RATELIMIT_USERNAME_BURST = 5  # Failed logins a username may have in a burst
+    TRUSTED_PROXY_HOPS = 0  # Reverse proxies in front of the application whose X-Forwarded-For is trusted
     ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
+    PROFILE_CACHE_SIZE = 1024  # Profiles kept in memory by each process, 0 disables the cache
+    COMMENTS_PAGE_SIZE = 20  # Number of comments per page on the comments page
+    STREAM_FEED = True  # Stream the stream page to the client while the posts are read from the database
     WTF_CSRF_ENABLED = True  # TODO: I should probably implement this wtforms feature, but it's not a priority
+    PERMANENT_SESSION_LIFETIME = 86400  # Seconds a server-side session is kept after its last use
+    SESSION_REFRESH_INTERVAL = 300  # Seconds between extensions of the expiry time of a session
     SESSION_COOKIE_SECURE=True
     SESSION_COOKIE_HTTPONLY=True
     SESSION_COOKIE_SAMESITE='Strict'
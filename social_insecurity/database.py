@@ -12,7 +12,7 @@ Example:
 
 from __future__ import annotations
 
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
 import sqlite3
 from os import PathLike
 from pathlib import Path
@@ -20,6 +20,8 @@ from typing import Any, Optional, cast
 
 from flask import Flask, current_app, g
 
+from social_insecurity.pagination import page_query
+
 
 class SQLite3:
     """Provides a SQLite3 database extension for Flask.
@@ -84,20 +86,29 @@ class SQLite3:
         instance_path = Path(app.instance_path)
         database_path = path or app.config.get("SQLITE3_DATABASE_PATH")
 
+        # URI filenames, e.g. "file:name?mode=memory&cache=shared", are passed to SQLite as is.
+        self._uri = str(database_path).startswith("file:")
         if database_path:
-            if ":memory:" in str(database_path):
+            if self._uri or ":memory:" in str(database_path):
                 self._path = Path(database_path)
+                self._database = str(database_path)
             else:
                 self._path = instance_path / database_path
+                self._database = str(self._path)
         else:
             raise ValueError("No database path provided to SQLite3 extension")
 
-        if not self._path.exists():
-            self._path.parent.mkdir(parents=True)
+        if self._uri:
+            if schema and self._is_empty():
+                with app.app_context():
+                    self._init_database(schema)
+        else:
+            if not self._path.exists():
+                self._path.parent.mkdir(parents=True, exist_ok=True)
 
-        if schema and not self._path.exists():
-            with app.app_context():
-                self._init_database(schema)
+            if schema and not self._path.exists():
+                with app.app_context():
+                    self._init_database(schema)
 
         app.teardown_appcontext(self._close_connection)
 
@@ -106,27 +117,107 @@ class SQLite3:
         """Returns the connection to the SQLite3 database."""
         conn = getattr(g, "flask_sqlite3_connection", None)
         if conn is None:
-            conn = g.flask_sqlite3_connection = sqlite3.connect(self._path)
-            conn.row_factory = sqlite3.Row
+            conn = g.flask_sqlite3_connection = self.connect()
         return conn
 
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new connection to the SQLite3 database.
+
+        The connection is not tied to the application context, and must be closed by the caller.
+        """
+        conn = sqlite3.connect(self._database, uri=self._uri)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def executescript(self, script: str) -> None:
+        """Runs a SQL script on a new connection.
+
+        Used by the extensions to add their tables, indexes and triggers to a
+        database created before they were added to the schema file.
+
+        params:
+            script: The SQL script to run.
+
+        """
+        conn = self.connect()
+        try:
+            conn.executescript(script)
+        finally:
+            conn.close()
+
     def query(self, query: str, *args, one: bool = False) -> Any:
         """Queries the database and returns the result.'
 
         params:
             query: The SQL query to execute.
             one: Whether to return a single row or a list of rows.
-            args: Additional arguments to pass to the query.
+            args: Additional arguments to pass to the query, or a single dictionary of named parameters.
 
         returns: A single row, a list of rows or None.
 
         """
-        cursor = self.connection.execute(query, args)
+        parameters = args[0] if len(args) == 1 and isinstance(args[0], dict) else args
+        cursor = self.connection.execute(query, parameters)
         response = cursor.fetchone() if one else cursor.fetchall()
         cursor.close()
         self.connection.commit()
         return response
 
+    def query_dicts(self, query: str, *args, one: bool = False) -> Any:
+        """Queries the database and returns the result as plain dictionaries.
+
+        The rows are built as dictionaries directly by the cursor, which skips
+        the intermediate sqlite3.Row objects. The result can be passed straight
+        to a JSON encoder.
+
+        params:
+            query: The SQL query to execute.
+            one: Whether to return a single row or a list of rows.
+            args: Additional arguments to pass to the query, or a single dictionary of named parameters.
+
+        returns: A single dictionary, a list of dictionaries or None.
+
+        """
+        parameters = args[0] if len(args) == 1 and isinstance(args[0], dict) else args
+        cursor = self.connection.cursor()
+        cursor.execute(query, parameters)
+        cursor.row_factory = _dict_factory(cursor.description)
+        response = cursor.fetchone() if one else cursor.fetchall()
+        cursor.close()
+        self.connection.commit()
+        return response
+
+    def iterate(
+        self, first_query: str, next_query: str, parameters: dict[str, Any], *, batch_size: int = 100
+    ) -> Iterator[dict[str, Any]]:
+        """Queries the database in batches and yields the rows as dictionaries.
+
+        Every batch is read with its own short keyset query, which has finished
+        before the first of its rows is yielded. No statement stays open while
+        the caller works through the rows, e.g. while a streamed page is sent to
+        a slow client, so the reader never holds a lock or pins a WAL snapshot.
+        Rows written between two batches may or may not be yielded.
+
+        Both queries must order the rows by (creation_time, id) descending, and
+        take the number of rows as :limit. The next query also takes the
+        position of the last row read, as :creation_time and :id, and must only
+        return the rows after it, see pagination.py.
+
+        params:
+            first_query: The SQL query reading the first batch.
+            next_query: The SQL query reading the batch after a position.
+            parameters: A dictionary of named parameters passed to both queries.
+            batch_size: The number of rows read per query.
+
+        """
+        position: Optional[tuple[str, int]] = None
+        while True:
+            rows = self.query_dicts(*page_query(first_query, next_query, position, parameters, batch_size))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            position = (rows[-1]["creation_time"], rows[-1]["id"])
+
     # TODO: Add more specific query methods to simplify code
 
     def retrieve_user_by_username(
@@ -187,14 +278,46 @@ class SQLite3:
             # The finally clause is always executed on the way out.
             db_cur.close()
 
+    def _is_empty(self) -> bool:
+        """Returns whether the database has no schema yet."""
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()[0] == 0
+        finally:
+            conn.close()
+
     def _init_database(self, schema: PathLike | str) -> None:
         """Initializes the database with the supplied schema if it does not exist yet."""
         with current_app.open_resource(str(schema), mode="r") as file:
             self.connection.executescript(file.read())
             self.connection.commit()
 
-    def _close_connection(self, exception: Optional[BaseException] = None) -> None:
-        """Closes the connection to the database."""
-        conn = cast(sqlite3.Connection, getattr(g, "flask_sqlite3_connection", None))
+    def close(self) -> None:
+        """Closes the connection of the current application context, if one is open.
+
+        The connection is also removed from g, because a streamed response pushes the application
+        context again after the teardown and must then open a new connection.
+        """
+        conn = cast(sqlite3.Connection, g.pop("flask_sqlite3_connection", None))
         if conn is not None:
             conn.close()
+
+    def _close_connection(self, exception: Optional[BaseException] = None) -> None:
+        """Closes the connection to the database when the application context is torn down."""
+        self.close()
+
+
+def _dict_factory(description: Optional[tuple]) -> Callable[[sqlite3.Cursor, tuple], dict[str, Any]]:
+    """Returns a row factory that builds a dictionary from a row, keyed by the column names.
+
+    The column names are read from the cursor description once per query
+    instead of once per row. The row factory must be set after the query is
+    executed, since the description is only known then.
+
+    """
+    names = tuple(column[0] for column in description or ())
+
+    def factory(cursor: sqlite3.Cursor, row: tuple) -> dict[str, Any]:
+        return dict(zip(names, row))
+
+    return factory
@@ -0,0 +1,269 @@
+"""Provides background maintenance of the SQLite3 database.
+
+This extension keeps the query planner statistics fresh, returns free pages
+to the file system, deletes expired sessions and checkpoints the write-ahead
+log. The tasks run in a background thread once the application has been idle
+for a while, or on demand with 'flask maintenance'.
+
+Every task runs on its own connection and within a time budget. A task that
+runs out of time is interrupted and reported, it is simply picked up again on
+the next run.
+
+Example:
+    from flask import Flask
+    from social_insecurity.database import SQLite3
+    from social_insecurity.maintenance import DatabaseMaintenance
+
+    app = Flask(__name__)
+    sqlite = SQLite3(app)
+    maintenance = DatabaseMaintenance(app, sqlite)
+
+    # Run all tasks now
+    # maintenance.run()
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+
+# Number of pages freed per incremental vacuum step.
+VACUUM_STEP_PAGES = 256
+# Number of expired sessions deleted per transaction.
+SESSIONS_BATCH_SIZE = 500
+# Number of SQLite virtual machine instructions between deadline checks.
+PROGRESS_INTERVAL = 10_000
+
+
+@dataclass
+class TaskResult:
+    """The outcome and metrics of a single maintenance task."""
+
+    name: str
+    status: str  # "completed", "interrupted", "skipped" or "failed"
+    duration: float  # Seconds
+    metrics: dict[str, int | str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        metrics = ", ".join(f"{key}={value}" for key, value in self.metrics.items())
+        return f"{self.name} {self.status} in {self.duration * 1000:.1f} ms" + (f" ({metrics})" if metrics else "")
+
+
+def optimize(conn: sqlite3.Connection, deadline: float, checkpoint_mode: str) -> dict[str, int | str]:
+    """Refreshes the query planner statistics where they are stale."""
+    if sqlite3.sqlite_version_info >= (3, 46, 0):
+        # 0x10000 checks all tables, not only the ones used by this connection.
+        conn.execute("PRAGMA optimize = 0x10002;")
+    else:
+        # Older versions only optimize tables used by this connection, so analyze with a row limit instead.
+        conn.execute("PRAGMA analysis_limit = 400;")
+        conn.execute("ANALYZE;")
+    return {}
+
+
+def vacuum(conn: sqlite3.Connection, deadline: float, checkpoint_mode: str) -> dict[str, int | str]:
+    """Returns free pages to the file system in small steps, until the deadline."""
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+        raise _Skipped("auto_vacuum is not INCREMENTAL")
+    freelist = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    freed = 0
+    while freed < freelist and time.monotonic() < deadline:
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});").fetchall()
+        freed = freelist - conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    if freed < freelist:
+        raise _Interrupted({"pages_freed": freed, "pages_left": freelist - freed})
+    return {"pages_freed": freed}
+
+
+def checkpoint(conn: sqlite3.Connection, deadline: float, checkpoint_mode: str) -> dict[str, int | str]:
+    """Copies the write-ahead log back into the database file.
+
+    A PASSIVE checkpoint never waits for readers or writers. A TRUNCATE checkpoint
+    also resets the log file to zero bytes, but has to wait for other connections.
+    """
+    if conn.execute("PRAGMA journal_mode;").fetchone()[0] != "wal":
+        raise _Skipped("journal_mode is not WAL")
+    busy, log_frames, checkpointed_frames = conn.execute(f"PRAGMA wal_checkpoint({checkpoint_mode});").fetchone()
+    metrics: dict[str, int | str] = {
+        "mode": checkpoint_mode.lower(),
+        "log_frames": log_frames,
+        "checkpointed_frames": checkpointed_frames,
+    }
+    if busy:
+        raise _Interrupted(metrics)
+    return metrics
+
+
+def sessions(conn: sqlite3.Connection, deadline: float, checkpoint_mode: str) -> dict[str, int | str]:
+    """Deletes expired sessions in small batches, until the deadline.
+
+    Each batch is its own transaction, so requests that save a session only
+    ever wait for a single batch.
+    """
+    if not conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'Sessions';").fetchone()[0]:
+        raise _Skipped("no Sessions table")
+    now = int(time.time())
+    deleted = 0
+    while time.monotonic() < deadline:
+        with conn:
+            count = conn.execute(
+                "DELETE FROM Sessions WHERE id IN (SELECT id FROM Sessions WHERE expires <= ? LIMIT ?);",
+                (now, SESSIONS_BATCH_SIZE),
+            ).rowcount
+        deleted += count
+        if count < SESSIONS_BATCH_SIZE:
+            return {"sessions_deleted": deleted}
+    raise _Interrupted({"sessions_deleted": deleted})
+
+
+TASKS: dict[str, Callable[[sqlite3.Connection, float, str], dict[str, int | str]]] = {
+    "optimize": optimize,
+    "vacuum": vacuum,
+    "sessions": sessions,
+    "checkpoint": checkpoint,
+}
+
+
+class DatabaseMaintenance:
+    """Provides background maintenance of the SQLite3 database as a Flask extension.
+
+    The scheduler thread is started by the first request of each process, which
+    keeps it working with servers that fork workers after loading the application.
+    """
+
+    def __init__(self, app: Optional[Flask] = None, sqlite: Optional[SQLite3] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the database to maintain.
+
+        """
+        self.history: deque[TaskResult] = deque(maxlen=100)
+        if app is not None and sqlite is not None:
+            self.init_app(app, sqlite)
+
+    def init_app(self, app: Flask, sqlite: SQLite3) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the database to maintain.
+
+        """
+        if "database_maintenance" in app.extensions:
+            raise RuntimeError("Flask DatabaseMaintenance extension already initialized")
+        app.extensions["database_maintenance"] = self
+        self._sqlite = sqlite
+        self._enabled = bool(app.config.get("MAINTENANCE_ENABLED", True)) and not app.testing
+        self._interval = float(app.config.get("MAINTENANCE_INTERVAL", 3600))
+        self._idle_time = float(app.config.get("MAINTENANCE_IDLE_TIME", 30))
+        self._budget = float(app.config.get("MAINTENANCE_TASK_BUDGET", 1.0))
+        self._checkpoint_mode = str(app.config.get("MAINTENANCE_CHECKPOINT_MODE", "PASSIVE")).upper()
+        self._last_activity = time.monotonic()
+        self._last_run = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        app.before_request(self._record_activity)
+
+    def run(
+        self,
+        tasks: Optional[Iterable[str]] = None,
+        *,
+        budget: Optional[float] = None,
+        checkpoint_mode: Optional[str] = None,
+    ) -> list[TaskResult]:
+        """Runs maintenance tasks and returns their results.
+
+        params:
+            tasks (optional): The names of the tasks to run, see TASKS. Defaults to all tasks.
+            budget (optional): The time budget of each task in seconds.
+            checkpoint_mode (optional): PASSIVE or TRUNCATE, the mode of the WAL checkpoint.
+
+        returns: A list of task results.
+
+        """
+        results = []
+        for name in tasks or TASKS:
+            result = self._run_task(
+                name,
+                self._budget if budget is None else budget,
+                (checkpoint_mode or self._checkpoint_mode).upper(),
+            )
+            print(f"Maintenance: {result}")
+            self.history.append(result)
+            results.append(result)
+        self._last_run = time.monotonic()
+        return results
+
+    def _run_task(self, name: str, budget: float, checkpoint_mode: str) -> TaskResult:
+        """Runs a single task on its own connection, interrupting it once the budget is spent."""
+        task = TASKS[name]
+        start = time.monotonic()
+        deadline = start + budget
+        conn = self._sqlite.connect()
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), PROGRESS_INTERVAL)
+        try:
+            metrics = task(conn, deadline, checkpoint_mode)
+            status = "completed"
+        except _Skipped as skipped:
+            metrics, status = {"reason": str(skipped)}, "skipped"
+        except _Interrupted as interrupted:
+            metrics, status = interrupted.metrics, "interrupted"
+        except sqlite3.OperationalError as err:
+            if "interrupted" not in str(err):
+                print(err)
+                metrics, status = {}, "failed"
+            else:
+                metrics, status = {}, "interrupted"
+        except sqlite3.Error as err:
+            print(err)
+            metrics, status = {}, "failed"
+        finally:
+            conn.close()
+        return TaskResult(name, status, time.monotonic() - start, metrics)
+
+    def _record_activity(self) -> None:
+        """Records the time of the request and starts the scheduler in this process if needed."""
+        self._last_activity = time.monotonic()
+        if self._enabled and self._thread_pid != os.getpid():
+            with self._lock:
+                if self._thread_pid != os.getpid():
+                    self._thread_pid = os.getpid()
+                    self._thread = threading.Thread(target=self._schedule, name="maintenance", daemon=True)
+                    self._thread.start()
+
+    def _schedule(self) -> None:
+        """Runs all tasks whenever the interval has passed and the application is idle."""
+        while True:
+            time.sleep(min(self._idle_time, self._interval, 60.0))
+            now = time.monotonic()
+            if now - self._last_run >= self._interval and now - self._last_activity >= self._idle_time:
+                try:
+                    self.run()
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    # Keep the scheduler alive, the next run may succeed.
+                    print(f"Maintenance: Run failed: {err}")
+
+
+class _Skipped(Exception):
+    """Raised by a task that does not apply to the database."""
+
+
+class _Interrupted(Exception):
+    """Raised by a task that ran out of time or was blocked, with the metrics so far."""
+
+    def __init__(self, metrics: dict[str, int | str]) -> None:
+        super().__init__("interrupted")
+        self.metrics = metrics
@@ -0,0 +1,149 @@
+"""Provides keyset pagination helpers for the Social Insecurity application.
+
+Pages are addressed by an opaque cursor instead of an OFFSET. A query for a
+later page compares (creation_time, id) with the cursor position, which lets
+SQLite seek into an index on creation_time instead of reading and skipping
+every row before the position. The comparison must not be made optional with
+an OR, e.g. ":creation_time IS NULL OR ...", because SQLite then falls back to
+reading from the start. Use a separate query for the first page instead.
+
+Comments.creation_time has no default and may be NULL, e.g. in imported rows,
+and a NULL never compares less than the cursor position. The comment queries
+therefore sort and compare on COALESCE(creation_time, ''), which the
+Comments_p_id_sort_time index covers, and a NULL creation_time is encoded in
+the cursor as ''. A scalar bound on that expression in addition to the row
+value comparison lets SQLite seek into the index.
+
+The feed and comment queries are shared by the HTML routes and the JSON API,
+each as a first page and a next page query.
+
+Example:
+    from social_insecurity.pagination import FEED_FIRST_PAGE, FEED_NEXT_PAGE, decode_cursor, encode_cursor, page_query
+
+    cursor = encode_cursor("2024-01-01 12:00:00", 42)
+    position = decode_cursor(cursor)
+    query, parameters = page_query(FEED_FIRST_PAGE, FEED_NEXT_PAGE, position, {"user_id": 1}, limit=20)
+"""
+
+from __future__ import annotations
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from typing import Any, Optional
+
+from werkzeug.exceptions import BadRequest  # 400
+
+# For databases created before the indexes were added to schema.sql.
+PAGINATION_INDEXES = """
+    CREATE INDEX IF NOT EXISTS [Posts_creation_time] ON [Posts](creation_time);
+    DROP INDEX IF EXISTS [Comments_p_id_creation_time];
+    CREATE INDEX IF NOT EXISTS [Comments_p_id_sort_time] ON [Comments](p_id, COALESCE(creation_time, ''));
+    """
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# The posts of a user and their friends, newest first. Takes :user_id and :limit, -1 for no limit.
+FEED_FIRST_PAGE = """
+    SELECT p.id, p.content, p.image, p.creation_time, u.username,
+           (SELECT COUNT(*) FROM Comments WHERE p_id = p.id) AS comment_count
+    FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+    WHERE p.u_id IN (SELECT u_id FROM Friends WHERE f_id = :user_id)
+       OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = :user_id)
+       OR p.u_id = :user_id
+    ORDER BY p.creation_time DESC, p.id DESC
+    LIMIT :limit;
+    """
+
+# The feed after the position (:creation_time, :id).
+FEED_NEXT_PAGE = """
+    SELECT p.id, p.content, p.image, p.creation_time, u.username,
+           (SELECT COUNT(*) FROM Comments WHERE p_id = p.id) AS comment_count
+    FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
+    WHERE (p.u_id IN (SELECT u_id FROM Friends WHERE f_id = :user_id)
+           OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = :user_id)
+           OR p.u_id = :user_id)
+      AND (p.creation_time, p.id) < (:creation_time, :id)
+    ORDER BY p.creation_time DESC, p.id DESC
+    LIMIT :limit;
+    """
+
+# The comments on a post, newest first. Takes :post_id and :limit.
+COMMENTS_FIRST_PAGE = """
+    SELECT c.id, c.comment, c.creation_time, u.username
+    FROM Comments AS c JOIN Users AS u ON c.u_id = u.id
+    WHERE c.p_id = :post_id
+    ORDER BY COALESCE(c.creation_time, '') DESC, c.id DESC
+    LIMIT :limit;
+    """
+
+# The comments after the position (:creation_time, :id).
+COMMENTS_NEXT_PAGE = """
+    SELECT c.id, c.comment, c.creation_time, u.username
+    FROM Comments AS c JOIN Users AS u ON c.u_id = u.id
+    WHERE c.p_id = :post_id
+      AND COALESCE(c.creation_time, '') <= :creation_time
+      AND (COALESCE(c.creation_time, ''), c.id) < (:creation_time, :id)
+    ORDER BY COALESCE(c.creation_time, '') DESC, c.id DESC
+    LIMIT :limit;
+    """
+
+
+def encode_cursor(creation_time: Optional[str], row_id: int) -> str:
+    """Encodes a (creation_time, id) position as an opaque URL safe cursor, with a NULL creation_time as ''."""
+    raw = f"{creation_time or ''}|{row_id}".encode("utf-8")
+    return urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> tuple[str, int] | None:
+    """Decodes a cursor created by encode_cursor().
+
+    returns: A (creation_time, id) tuple, or None if no cursor was given.
+
+    raises: BadRequest if the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        creation_time, row_id = raw.rsplit("|", 1)
+        return creation_time, int(row_id)
+    except (BinasciiError, UnicodeDecodeError, ValueError) as err:
+        raise BadRequest(description="Invalid cursor.") from err
+
+
+def page_query(
+    first_page: str, next_page: str, position: tuple[str, int] | None, parameters: dict[str, Any], limit: int
+) -> tuple[str, dict[str, Any]]:
+    """Chooses the query of a page, and adds the cursor position and the limit to its parameters.
+
+    params:
+        first_page: The query of the first page.
+        next_page: The query of the page after a position.
+        position: The position decoded from the cursor, or None for the first page.
+        parameters: The other named parameters of the queries.
+        limit: The number of rows to read.
+
+    returns: A (query, parameters) tuple.
+
+    """
+    if position is None:
+        return first_page, {**parameters, "limit": limit}
+    creation_time, row_id = position
+    return next_page, {**parameters, "creation_time": creation_time, "id": row_id, "limit": limit}
+
+
+def parse_limit(limit: Optional[str], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Parses a page size request argument and clamps it to MAX_PAGE_SIZE.
+
+    raises: BadRequest if the page size is not a positive integer.
+    """
+    if limit is None or limit == "":
+        return default
+    try:
+        value = int(limit)
+    except ValueError as err:
+        raise BadRequest(description="Invalid limit.") from err
+    if value < 1:
+        raise BadRequest(description="Invalid limit.")
+    return min(value, MAX_PAGE_SIZE)
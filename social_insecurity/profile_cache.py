@@ -0,0 +1,150 @@
+"""Provides a read cache of user profiles for the Social Insecurity application.
+
+Profiles change rarely but are read on every visit of a profile page. This
+extension keeps the most recently read profiles in a bounded LRU map, so a
+visit only has to read a single counter instead of the row from Users. The
+profile page reads that counter with its version stamp and passes it on, so a
+cache hit there costs no query at all.
+
+Every entry is tagged with the 'profile' counter in the Versions table, which
+the trigger in schema.sql bumps only when one of the profile fields changes.
+An entry whose counter is behind is read again, so the cache stays correct
+when another worker process updates a profile. The update_profile write path
+also invalidates its entry directly.
+
+Example:
+    from flask import Flask
+    from social_insecurity.database import SQLite3
+    from social_insecurity.profile_cache import ProfileCache
+
+    app = Flask(__name__)
+    sqlite = SQLite3(app)
+    profiles = ProfileCache(app, sqlite)
+
+    # Read a profile through the cache
+    # user = profiles.get(user_id)
+
+    # Reuse the counter of a version stamp
+    # stamp = stamps.profile(user_id)
+    # user = profiles.get(user_id, stamp.counter)
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from flask import Flask
+
+from social_insecurity.database import SQLite3
+
+
+class ProfileCache:
+    """Provides a bounded LRU cache of user profiles as a Flask extension."""
+
+    def __init__(self, app: Optional[Flask] = None, sqlite: Optional[SQLite3] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Users and Versions tables.
+
+        """
+        self._entries: OrderedDict[int, tuple[int, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_size = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        if app is not None and sqlite is not None:
+            self.init_app(app, sqlite)
+
+    def init_app(self, app: Flask, sqlite: SQLite3) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Users and Versions tables.
+
+        """
+        if "profile_cache" in app.extensions:
+            raise RuntimeError("Flask ProfileCache extension already initialized")
+        app.extensions["profile_cache"] = self
+        self._sqlite = sqlite
+        self._max_size = int(app.config.get("PROFILE_CACHE_SIZE", 1024))
+
+    def get(self, user_id: int, version: Optional[int] = None) -> Optional[dict[str, Any]]:
+        """Returns the profile of a user, without the password hash.
+
+        params:
+            user_id: The id of the user.
+            version: The 'profile' counter of the user, if the caller has already read it.
+
+        returns: The profile as a dictionary, or None if there is no such user.
+
+        """
+        if version is None:
+            version = self._version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and version is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        get_profile = """
+            SELECT id, username, first_name, last_name,
+                   education, employment, music, movie, nationality, birthday
+            FROM Users
+            WHERE id = ?;
+            """
+        user = self._sqlite.query_dicts(get_profile, user_id, one=True)
+        # The version was read before the row, so a concurrent update can only make the entry look stale.
+        if user is not None and version is not None and self._max_size > 0:
+            with self._lock:
+                self._entries[user_id] = (version, user)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self._max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return user
+
+    def invalidate(self, user_id: int) -> None:
+        """Drops the cached profile of a user."""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drops all cached profiles and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Returns the size and the hit and miss counters of the cache in this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _version(self, user_id: int) -> Optional[int]:
+        """Reads the profile counter of a user, or returns None if the database has no Versions table."""
+        get_version = """
+            SELECT counter
+            FROM Versions
+            WHERE scope = 'profile' AND key = ?;
+            """
+        try:
+            row = self._sqlite.query(get_version, user_id, one=True)
+        except sqlite3.OperationalError:
+            return None
+        return row["counter"] if row is not None else 0
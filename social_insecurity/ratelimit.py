@@ -0,0 +1,301 @@
+"""Provides rate limiting of login and registration attempts.
+
+Every password check costs a bcrypt hash, so a burst of login attempts can
+use up all CPU time. This extension throttles the attempts with token
+buckets, before any hashing happens:
+
+    - One bucket per client IP address, drained by every login and registration attempt.
+    - One bucket per username, drained by every login attempt for that username.
+      A successful login gets its token back, so only failed logins count.
+
+The username token is taken before the password is checked and refunded
+after a success, rather than taken after a failure. Otherwise concurrent
+attempts on one username would all pass the check before the first failure
+was recorded, and the limit would not bound the hashing.
+
+A bucket holds at most burst tokens and refills at rate tokens per second. A
+bucket is stored as a (tokens, updated) pair. A full bucket is equivalent to
+no bucket at all, so the stores may forget buckets that have refilled.
+
+The buckets live in memory by default, in a bounded LRU map. With
+RATELIMIT_STORAGE = "sqlite" they live in a small SQLite database in the
+instance folder instead, which is shared by all worker processes.
+
+Example:
+    from flask import Flask
+    from social_insecurity.ratelimit import RateLimiter
+
+    app = Flask(__name__)
+    limiter = RateLimiter(app)
+
+    # Raises TooManyRequests if the client or the username is throttled
+    # limiter.limit_login(username)
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Protocol
+
+from flask import Flask, current_app, request
+from werkzeug.exceptions import TooManyRequests  # 429
+
+
+class BucketStore(Protocol):
+    """Stores token buckets by key."""
+
+    def take(self, key: str, rate: float, burst: float, cost: float, consume: bool = True) -> float:
+        """Takes cost tokens from a bucket, if it holds enough of them.
+
+        If consume is False, the bucket is only checked for the tokens.
+
+        returns: 0.0 if the tokens are available, otherwise the seconds until they are.
+
+        """
+
+    def refund(self, key: str, rate: float, burst: float, cost: float) -> None:
+        """Gives cost tokens back to a bucket, up to burst."""
+
+    def clear(self) -> None:
+        """Forgets all buckets."""
+
+    def close(self) -> None:
+        """Closes the resources the store holds in the current thread."""
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    """Returns the tokens in a bucket after refilling it from updated until now."""
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """Stores token buckets in a bounded LRU map, local to the process."""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float, consume: bool = True) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = refill(tokens, updated, now, rate, burst)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if consume and not wait:
+                tokens -= cost
+            if tokens < burst:
+                self._buckets[key] = (tokens, now)
+                # The least recently used buckets are evicted first.
+                while len(self._buckets) > self._max_keys:
+                    self._buckets.popitem(last=False)
+            return wait
+
+    def refund(self, key: str, rate: float, burst: float, cost: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, refill(tokens, updated, now, rate, burst) + cost)
+            if tokens < burst:
+                self._buckets[key] = (tokens, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def close(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Stores token buckets in a SQLite database, shared by all processes on the host.
+
+    If the database stays locked by other processes for longer than the busy
+    timeout, the store fails closed: take() reports busy_wait seconds to wait,
+    so the attempt is throttled instead of failing with a server error or being
+    let through unchecked. A refund that cannot get the lock is dropped.
+    """
+
+    # Full buckets are deleted every cleanup_interval takes.
+    cleanup_interval = 1000
+    # Seconds to wait for the lock of the database before giving up.
+    busy_timeout = 1.0
+    # Seconds a client is told to wait when the store was too busy to check its bucket.
+    busy_wait = 1.0
+
+    def __init__(self, path: Path, max_age: float = 3600.0) -> None:
+        self._path = path
+        self._max_age = max_age
+        self._takes = 0
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS Buckets ("
+            "key VARCHAR PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL"
+            ") WITHOUT ROWID;"
+        )
+
+    def take(self, key: str, rate: float, burst: float, cost: float, consume: bool = True) -> float:
+        now = time.time()
+        conn = self._connection()
+        # The write lock is taken up front, so concurrent takes cannot both spend the same tokens.
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+        except sqlite3.OperationalError:
+            return self.busy_wait
+        try:
+            row = conn.execute("SELECT tokens, updated FROM Buckets WHERE key = ?;", (key,)).fetchone()
+            tokens = refill(*row, now, rate, burst) if row else burst
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if consume and not wait:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO Buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated;",
+                (key, tokens, now),
+            )
+            self._takes += 1
+            if self._takes % self.cleanup_interval == 0:
+                conn.execute("DELETE FROM Buckets WHERE updated < ?;", (now - self._max_age,))
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        return wait
+
+    def refund(self, key: str, rate: float, burst: float, cost: float) -> None:
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+        except sqlite3.OperationalError:
+            return
+        try:
+            row = conn.execute("SELECT tokens, updated FROM Buckets WHERE key = ?;", (key,)).fetchone()
+            if row is not None:
+                tokens = min(burst, refill(*row, now, rate, burst) + cost)
+                conn.execute("UPDATE Buckets SET tokens = ?, updated = ? WHERE key = ?;", (tokens, now, key))
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM Buckets;")
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self._path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = OFF;")
+        return conn
+
+
+class RateLimiter:
+    """Provides rate limiting of login and registration attempts as a Flask extension.
+
+    The limits are read from the configuration on every check, so they can be
+    changed at runtime. The store is chosen once, when the extension is initialized.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        self.store: Optional[BucketStore] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+
+        """
+        if "rate_limiter" in app.extensions:
+            raise RuntimeError("Flask RateLimiter extension already initialized")
+        app.extensions["rate_limiter"] = self
+        if app.config.get("RATELIMIT_STORAGE", "memory") == "sqlite":
+            path = Path(app.instance_path) / app.config.get("RATELIMIT_STORAGE_PATH", "ratelimit.db")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            max_age = max(
+                app.config["RATELIMIT_IP_BURST"] / app.config["RATELIMIT_IP_RATE"],
+                app.config["RATELIMIT_USERNAME_BURST"] / app.config["RATELIMIT_USERNAME_RATE"],
+            )
+            self.store = SQLiteBucketStore(path, max_age=max_age)
+        else:
+            self.store = MemoryBucketStore(app.config.get("RATELIMIT_MAX_KEYS", 100_000))
+
+    def limit_ip(self) -> None:
+        """Takes a token from the bucket of the client IP address.
+
+        raises: TooManyRequests if the bucket is empty.
+
+        """
+        if not current_app.config.get("RATELIMIT_ENABLED", True):
+            return
+        self._take(
+            f"ip:{request.remote_addr}",
+            current_app.config["RATELIMIT_IP_RATE"],
+            current_app.config["RATELIMIT_IP_BURST"],
+        )
+
+    def limit_login(self, username: str) -> None:
+        """Checks a login attempt, before the password is hashed.
+
+        It takes a token from the bucket of the client IP address, and reserves a
+        token from the bucket of the username. Call record_success() after a
+        successful login to give the reserved token back.
+
+        raises: TooManyRequests if either bucket is empty.
+
+        """
+        if not current_app.config.get("RATELIMIT_ENABLED", True):
+            return
+        self.limit_ip()
+        self._take(
+            f"username:{username.lower()}",
+            current_app.config["RATELIMIT_USERNAME_RATE"],
+            current_app.config["RATELIMIT_USERNAME_BURST"],
+        )
+
+    def record_success(self, username: str) -> None:
+        """Gives the token reserved by limit_login() back to the bucket of the username."""
+        if not current_app.config.get("RATELIMIT_ENABLED", True):
+            return
+        assert self.store is not None
+        self.store.refund(
+            f"username:{username.lower()}",
+            current_app.config["RATELIMIT_USERNAME_RATE"],
+            current_app.config["RATELIMIT_USERNAME_BURST"],
+            1.0,
+        )
+
+    def _take(self, key: str, rate: float, burst: float) -> None:
+        """Takes a token from a bucket, and raises TooManyRequests if it is empty."""
+        assert self.store is not None
+        wait = self.store.take(key, rate, burst, 1.0)
+        if wait:
+            raise TooManyRequests(
+                description="Too many attempts, please try again later.",
+                retry_after=int(wait) + 1,
+            )
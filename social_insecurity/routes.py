@@ -7,17 +7,20 @@ It also contains the SQL queries used for communicating with the database.
 from pathlib import Path
 
 from flask import current_app as app
-from flask import flash, redirect, render_template, send_from_directory, url_for
+from flask import Response, flash, get_flashed_messages, redirect, render_template, request, send_from_directory
+from flask import stream_template, url_for
 from flask import g # g is a LocalProxy.
-from flask import session # session is a LocalProxy.
 from flask.ctx import _AppCtxGlobals as ACG # g type.
-from flask.sessions import SecureCookieSession as SCS # session type.
+from flask_wtf.csrf import generate_csrf
 
-from social_insecurity import sqlite, bcrypt
+from social_insecurity import sqlite, bcrypt, limiter, profiles, stamps
 from social_insecurity.forms import CommentsForm, FriendsForm, IndexForm, PostForm, ProfileForm
-from social_insecurity.sessions_handler import load_user
+from social_insecurity.pagination import COMMENTS_FIRST_PAGE, COMMENTS_NEXT_PAGE, FEED_FIRST_PAGE, FEED_NEXT_PAGE
+from social_insecurity.pagination import decode_cursor, encode_cursor, page_query
+from social_insecurity.sessions_handler import load_user, login_user
 
-from typing import cast
+from collections.abc import Iterator
+from typing import Optional, cast
 
 from werkzeug.exceptions import BadRequest # 400
 from werkzeug.exceptions import Unauthorized # 401
@@ -56,20 +59,17 @@ def index():
             if password is None:
                 raise BadRequest(description="No password.")
 
-            # Set login credentials in the Secure Cookie Session (SCS).
-            # pylint: disable=protected-access
-            scs: SCS = cast(LocalProxy[SCS], session)._get_current_object()
-            scs["username"] = username
-            scs["password"] = password
+            # Throttle the attempt before login_user() spends a bcrypt check on it.
+            # A token of the username is reserved here, and given back on success.
+            limiter.limit_login(username)
 
-            # load_user() will validate the cookie session against the SQLite3
-            # database.
-            load_user()
+            # login_user() will validate the login credentials against the
+            # SQLite3 database, and store the user id in the server-side session.
+            login_user(username, password)
 
             # Retrieve user data from the Application Context Globals (ACG).
             # acg.user_id is an Application Context Global (ACG) variable. This
-            # global variable will indicate if the user has a valid cookie
-            # session.
+            # global variable will indicate if the user has a valid session.
             # acg.user_id is set to None if load_user() failed a check.
             # acg.user_id is set to an integer if load_user() passed all checks.
             # pylint: disable=protected-access
@@ -83,6 +83,7 @@ def index():
                 #raise Unauthorized(description="Not logged in.")
             else:
                 print(f"Login as user_id: {acg.user_id}.")
+                limiter.record_success(username)
                 flash((
                     f"You are logged in as {acg.user_username}"
                     f" with user id {acg.user_id}."
@@ -101,6 +102,7 @@ def index():
         if not register_form.validate_on_submit():
             flash("Your submitted form data is not valid.", category="warning")
         else:
+            limiter.limit_ip()
             hashed_password = register_form.hash_password(bcrypt)
             insert_user = """
                 INSERT INTO Users (username, first_name, last_name, password)
@@ -129,6 +131,11 @@ def stream(username: str):
         """
     user = sqlite.query(get_user, username, one=True)
 
+    # Answer conditional GETs before running the feed query.
+    not_modified = stamps.evaluate(stamps.circle(user["id"]))
+    if not_modified is not None:
+        return not_modified
+
     if post_form.validate_on_submit():
         secure_filename_: str = secure_filename(filename=post_form.image.data.filename)
         if post_form.image.data:
@@ -146,18 +153,41 @@ def stream(username: str):
                      )
         return redirect(url_for("stream", username=username))
 
-    get_posts = """
-         SELECT p.*, u.*, (SELECT COUNT(*) FROM Comments WHERE p_id = p.id) AS cc
-         FROM Posts AS p JOIN Users AS u ON u.id = p.u_id
-         WHERE p.u_id IN (SELECT u_id FROM Friends WHERE f_id = ?) OR p.u_id IN (SELECT f_id FROM Friends WHERE u_id = ?) OR p.u_id = ?
-         ORDER BY p.creation_time DESC;
-        """
-    posts = sqlite.query(get_posts,
-                         user["id"],
-                         user["id"],
-                         user["id"]
-                         )
-    return render_template("stream.html.j2", title="Stream", username=username, form=post_form, posts=posts)
+    if not app.config["STREAM_FEED"]:
+        posts = sqlite.query_dicts(FEED_FIRST_PAGE, {"user_id": user["id"], "limit": -1})
+        return render_template("stream.html.j2", title="Stream", username=username, form=post_form, posts=posts)
+
+    # Stream the page, the post cards are rendered while the next batch of posts is read.
+    # Each batch has its own query, so no statement stays open while the page is sent.
+    posts = sqlite.iterate(FEED_FIRST_PAGE, FEED_NEXT_PAGE, {"user_id": user["id"]})
+    return stream_page("stream.html.j2", title="Stream", username=username, form=post_form, posts=posts)
+
+
+def stream_page(template_name: str, **context) -> Response:
+    """Renders a template into a streamed response.
+
+    The response headers, and with them the session cookie, are sent before the template is rendered.
+    The flashed messages and the CSRF token change the session, so they are prepared here.
+    """
+    get_flashed_messages(with_categories=True)
+    if app.config.get("WTF_CSRF_ENABLED", True):
+        generate_csrf()
+    return app.response_class(buffered(stream_template(template_name, **context)))
+
+
+def buffered(chunks: Iterator[str], size: int = 1024) -> Iterator[str]:
+    """Joins the many small chunks rendered by Jinja2 into chunks of at least size characters."""
+    buffer: list[str] = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer.clear()
+            length = 0
+    if buffer:
+        yield "".join(buffer)
 
 
 @app.route("/comments/<string:username>/<int:post_id>", methods=["GET", "POST"])
@@ -166,7 +196,8 @@ def comments(username: str, post_id: int):
 
     If a form was submitted, it reads the form data and inserts a new comment into the database.
 
-    Otherwise, it reads the username and post id from the URL and displays all comments for the post.
+    Otherwise, it reads the username and post id from the URL and displays the newest comments for the post.
+    Older comments are paged in with the cursor in the URL, see comments_page().
     """
     comments_form = CommentsForm()
     get_user = """
@@ -176,6 +207,10 @@ def comments(username: str, post_id: int):
         """
     user = sqlite.query(get_user, username, one=True)
 
+    not_modified = stamps.evaluate(stamps.post(post_id))
+    if not_modified is not None:
+        return not_modified
+
     if comments_form.validate_on_submit():
         insert_comment = """
             INSERT INTO Comments (p_id, u_id, comment, creation_time)
@@ -192,17 +227,55 @@ def comments(username: str, post_id: int):
         FROM Posts AS p JOIN Users AS u ON p.u_id = u.id
         WHERE p.id = ?;
         """
-    get_comments = """
-        SELECT DISTINCT *
-        FROM Comments AS c JOIN Users AS u ON c.u_id = u.id
-        WHERE c.p_id= ?
-        ORDER BY c.creation_time DESC;
-        """
     post = sqlite.query(get_post, post_id, one=True)
-    comments = sqlite.query(get_comments, post_id)
+    comments, next_cursor = get_comments_page(post_id, request.args.get("cursor"))
+    return render_template(
+        "comments.html.j2",
+        title="Comments",
+        username=username,
+        form=comments_form,
+        post=post,
+        post_id=post_id,
+        comments=comments,
+        next_cursor=next_cursor,
+    )
+
+
+@app.route("/comments/<string:username>/<int:post_id>/page")
+def comments_page(username: str, post_id: int):
+    """Provides a page of comment cards as an HTML fragment.
+
+    It is fetched by the "Load more comments" link on the comments page. The cursor in the URL
+    points to the last comment already shown.
+    """
+    not_modified = stamps.evaluate(stamps.post(post_id))
+    if not_modified is not None:
+        return not_modified
+
+    comments, next_cursor = get_comments_page(post_id, request.args.get("cursor"))
     return render_template(
-        "comments.html.j2", title="Comments", username=username, form=comments_form, post=post, comments=comments
+        "comment_cards.html.j2", username=username, post_id=post_id, comments=comments, next_cursor=next_cursor
+    )
+
+
+def get_comments_page(post_id: int, cursor: Optional[str]) -> tuple[list, Optional[str]]:
+    """Returns a page of comments on a post, newest first, and the cursor of the next page.
+
+    A later page seeks into the Comments_p_id_sort_time index at the cursor position instead
+    of skipping the comments before it. The first page has its own query without the cursor
+    predicate, because an optional predicate would keep SQLite from using the index for the seek.
+    """
+    page_size = app.config["COMMENTS_PAGE_SIZE"]
+    position = decode_cursor(cursor)
+    get_comments, parameters = page_query(
+        COMMENTS_FIRST_PAGE, COMMENTS_NEXT_PAGE, position, {"post_id": post_id}, page_size + 1
     )
+    comments = sqlite.query(get_comments, parameters)
+    next_cursor = None
+    if len(comments) > page_size:
+        comments = comments[:page_size]
+        next_cursor = encode_cursor(comments[-1]["creation_time"], comments[-1]["id"])
+    return comments, next_cursor
 
 
 @app.route("/friends/<string:username>", methods=["GET", "POST"])
@@ -230,6 +303,10 @@ def friends(username: str):
         """
     user = sqlite.query(get_user, username, one=True)
 
+    not_modified = stamps.evaluate(stamps.user(user["id"]))
+    if not_modified is not None:
+        return not_modified
+
     if friends_form.validate_on_submit():
         get_friend = """
             SELECT *
@@ -285,12 +362,12 @@ def profile(username: str):
         raise Unauthorized(description=(f"Not logged in as {username}."))
 
     profile_form = ProfileForm()
-    get_user = """
-        SELECT *
-        FROM Users
-        WHERE username = ?;
-        """
-    user = sqlite.query(get_user, username, one=True)
+
+    # The page only shows the profile fields, and the profile cache is tagged with the same counter.
+    stamp = stamps.profile(acg.user_id)
+    not_modified = stamps.evaluate(stamp)
+    if not_modified is not None:
+        return not_modified
 
     if profile_form.validate_on_submit():
         update_profile = """
@@ -308,8 +385,10 @@ def profile(username: str):
                      profile_form.nationality.data,
                      profile_form.birthday.data,
                      username)
+        profiles.invalidate(acg.user_id)
         return redirect(url_for("profile", username=username))
 
+    user = profiles.get(acg.user_id, stamp.counter if stamp is not None else None)
     return render_template("profile.html.j2", title="Profile", username=username, user=user, form=profile_form)
 
 
@@ -1,3 +1,12 @@
+-- --
+-- Configure database
+-- --
+
+-- Free pages are returned to the file system by the maintenance task, see maintenance.py.
+-- Must be set before the first table is created.
+PRAGMA auto_vacuum = INCREMENTAL;
+PRAGMA journal_mode = WAL;
+
 -- --
 -- Create tables
 -- --
@@ -43,6 +52,109 @@ CREATE TABLE IF NOT EXISTS [Comments](
   FOREIGN KEY (u_id) REFERENCES Users(id) ON DELETE CASCADE
 );
 
+CREATE INDEX IF NOT EXISTS [Friends_f_id] ON [Friends](f_id);
+
+-- Lets a feed page seek to its cursor position, see pagination.py.
+CREATE INDEX IF NOT EXISTS [Posts_creation_time] ON [Posts](creation_time);
+
+-- Comments.creation_time may be NULL, so the comment pages sort NULL as '', see pagination.py.
+CREATE INDEX IF NOT EXISTS [Comments_p_id_sort_time] ON [Comments](p_id, COALESCE(creation_time, ''));
+
+-- --
+-- Version stamps for conditional GET
+-- --
+
+-- A counter per user and per post, bumped by the triggers below whenever a
+-- write changes what the pages of that user or post show. A separate profile
+-- counter per user is bumped when the profile fields of that user change.
+CREATE TABLE IF NOT EXISTS [Versions](
+  scope VARCHAR NOT NULL,
+  [key] INTEGER NOT NULL,
+  counter INTEGER NOT NULL DEFAULT 1,
+  PRIMARY KEY (scope, [key])
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS [Users_insert_version] AFTER INSERT ON [Users]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS [Users_update_version] AFTER UPDATE ON [Users]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+-- Only the profile fields, so the profile cache survives new posts and logins, see profile_cache.py.
+CREATE TRIGGER IF NOT EXISTS [Users_profile_version]
+AFTER UPDATE OF username, first_name, last_name, education, employment, music, movie, nationality, birthday
+ON [Users]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('profile', NEW.id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS [Posts_insert_version] AFTER INSERT ON [Posts]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.u_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS [Posts_delete_version] AFTER DELETE ON [Posts]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', OLD.u_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+-- A comment changes the comment count shown in the feeds of the post author.
+CREATE TRIGGER IF NOT EXISTS [Comments_insert_version] AFTER INSERT ON [Comments]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('post', NEW.p_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+  INSERT INTO Versions (scope, [key]) SELECT 'user', u_id FROM Posts WHERE id = NEW.p_id
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS [Comments_delete_version] AFTER DELETE ON [Comments]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('post', OLD.p_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+  INSERT INTO Versions (scope, [key]) SELECT 'user', u_id FROM Posts WHERE id = OLD.p_id
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+-- A friendship changes the feeds of both users.
+CREATE TRIGGER IF NOT EXISTS [Friends_insert_version] AFTER INSERT ON [Friends]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', NEW.u_id), ('user', NEW.f_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS [Friends_delete_version] AFTER DELETE ON [Friends]
+BEGIN
+  INSERT INTO Versions (scope, [key]) VALUES ('user', OLD.u_id), ('user', OLD.f_id)
+  ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;
+END;
+
+-- --
+-- Server-side sessions
+-- --
+
+-- One row per session, keyed by a hash of the random id in the session cookie.
+-- The user id has its own column, the rest of the session data is stored as
+-- tagged JSON, or NULL if there is none. Expired rows are deleted in batches
+-- by the maintenance task, see maintenance.py.
+CREATE TABLE IF NOT EXISTS [Sessions](
+  id BLOB PRIMARY KEY,
+  user_id INTEGER,
+  expires INTEGER NOT NULL,
+  [data] BLOB,
+  FOREIGN KEY (user_id) REFERENCES [Users](id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS [Sessions_expires] ON [Sessions](expires);
+
 -- --
 -- Populate tables with test data
 -- --
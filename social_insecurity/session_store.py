@@ -0,0 +1,237 @@
+"""Provides server-side sessions for the Social Insecurity application.
+
+The session data is stored in the Sessions table of the application database.
+The session cookie only holds a random id of fixed size, and the table is
+keyed by a hash of that id, so a copy of the database cannot be used to take
+over sessions. Loading a session is a single primary key lookup.
+
+A session expires once it has not been used for PERMANENT_SESSION_LIFETIME.
+Its expiry time is extended at most once per SESSION_REFRESH_INTERVAL, so a
+request that does not change the session does not write to the database
+either. Expired rows are ignored when loading and deleted in batches by the
+"sessions" maintenance task.
+
+Example:
+    from flask import Flask
+    from social_insecurity.database import SQLite3
+    from social_insecurity.session_store import SessionStore
+
+    app = Flask(__name__)
+    sqlite = SQLite3(app)
+    sessions = SessionStore(app, sqlite)
+
+    # Issue a new session id, e.g. after a login
+    # session.regenerate()
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import secrets
+import time
+from typing import Any, Optional
+
+from flask import Flask, Request, Response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from social_insecurity.database import SQLite3
+
+# Number of random bytes in a session id. The cookie holds them base64 encoded, in 22 characters.
+SESSION_ID_BYTES = 16
+
+# For databases created before the Sessions table was added to schema.sql.
+SESSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS [Sessions](
+      id BLOB PRIMARY KEY,
+      user_id INTEGER,
+      expires INTEGER NOT NULL,
+      [data] BLOB,
+      FOREIGN KEY (user_id) REFERENCES [Users](id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS [Sessions_expires] ON [Sessions](expires);
+    """
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """A session whose data is stored on the server, identified by the id in the session cookie."""
+
+    def __init__(
+        self,
+        initial: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+        expires: int = 0,
+    ) -> None:
+        def on_update(self: ServerSideSession) -> None:
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.expires = expires
+        self.previous_session_id: Optional[str] = None
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key: str) -> Any:
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self) -> None:
+        """Issues a new session id when the session is saved, and deletes the old one.
+
+        Call this whenever the privileges of the session change, e.g. on login,
+        so an id planted in the browser before the change is worthless after it.
+        """
+        if self.session_id is not None:
+            self.previous_session_id = self.session_id
+        self.session_id = None
+        self.modified = True
+
+
+class SessionStore(SessionInterface):
+    """Provides server-side sessions, stored in the SQLite3 database, as a Flask extension."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app: Optional[Flask] = None, sqlite: Optional[SQLite3] = None) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Sessions table.
+
+        """
+        self._sqlite: Optional[SQLite3] = None
+        if app is not None and sqlite is not None:
+            self.init_app(app, sqlite)
+
+    def init_app(self, app: Flask, sqlite: SQLite3) -> None:
+        """Initializes the extension.
+
+        params:
+            app: The Flask application to initialize the extension with.
+            sqlite: The SQLite3 extension holding the Sessions table.
+
+        """
+        if "session_store" in app.extensions:
+            raise RuntimeError("Flask SessionStore extension already initialized")
+        app.extensions["session_store"] = self
+        self._sqlite = sqlite
+        self._refresh_interval = int(app.config.get("SESSION_REFRESH_INTERVAL", 300))
+        sqlite.executescript(SESSIONS_TABLE)
+        app.session_interface = self
+
+    def open_session(self, app: Flask, request: Request) -> ServerSideSession:
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        key = _key(session_id) if session_id else None
+        if key is None:
+            return ServerSideSession()
+        assert self._sqlite is not None
+        row = self._sqlite.connection.execute(
+            "SELECT user_id, expires, [data] FROM Sessions WHERE id = ? AND expires > ?;",
+            (key, int(time.time())),
+        ).fetchone()
+        if row is None:
+            return ServerSideSession()
+        user_id, expires, data = row
+        initial = self.serializer.loads(data.decode("utf-8")) if data is not None else {}
+        if user_id is not None:
+            initial["user_id"] = user_id
+        return ServerSideSession(initial, session_id, expires)
+
+    def save_session(self, app: Flask, session: SessionMixin, response: Response) -> None:
+        assert isinstance(session, ServerSideSession) and self._sqlite is not None
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session and session.session_id is None and session.previous_session_id is None:
+            # Nothing to store or delete, so no connection is needed.
+            return
+
+        conn = self._sqlite.connection
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        httponly = self.get_cookie_httponly(app)
+        expires = int(time.time() + app.permanent_session_lifetime.total_seconds())
+
+        with conn:
+            if session.previous_session_id is not None:
+                conn.execute("DELETE FROM Sessions WHERE id = ?;", (_key(session.previous_session_id),))
+                session.previous_session_id = None
+
+            if not session:
+                # An emptied session is deleted, and a session that was never filled is never stored.
+                if session.session_id is not None:
+                    conn.execute("DELETE FROM Sessions WHERE id = ?;", (_key(session.session_id),))
+                    response.delete_cookie(name, domain=domain, path=path, secure=secure, httponly=httponly)
+                    response.vary.add("Cookie")
+                return
+
+            if session.modified or session.session_id is None:
+                if session.session_id is None:
+                    session.session_id = _new_session_id()
+                data = {key: value for key, value in session.items() if key != "user_id"}
+                conn.execute(
+                    "INSERT INTO Sessions (id, user_id, expires, [data]) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET "
+                    "user_id = excluded.user_id, expires = excluded.expires, [data] = excluded.[data];",
+                    (
+                        _key(session.session_id),
+                        session.get("user_id"),
+                        expires,
+                        self.serializer.dumps(data).encode("utf-8") if data else None,
+                    ),
+                )
+            elif (
+                app.config["SESSION_REFRESH_EACH_REQUEST"]
+                and expires - session.expires >= self._refresh_interval
+            ):
+                conn.execute("UPDATE Sessions SET expires = ? WHERE id = ?;", (expires, _key(session.session_id)))
+                if not session.permanent:
+                    # The cookie of a non-permanent session has no expiry time to extend.
+                    session.expires = expires
+                    return
+            else:
+                return
+        session.expires = expires
+
+        response.set_cookie(
+            name,
+            session.session_id,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add("Cookie")
+
+
+def _new_session_id() -> str:
+    """Returns a new random session id, as stored in the session cookie."""
+    return base64.urlsafe_b64encode(secrets.token_bytes(SESSION_ID_BYTES)).decode("ascii").rstrip("=")
+
+
+def _key(session_id: str) -> Optional[bytes]:
+    """Returns the key of a session id in the Sessions table, or None if the id is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(session_id + "==")
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) != SESSION_ID_BYTES:
+        return None
+    return hashlib.blake2b(raw, digest_size=SESSION_ID_BYTES).digest()
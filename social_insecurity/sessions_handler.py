@@ -4,17 +4,19 @@
 from flask import g # g is a LocalProxy.
 from flask import session # session is a LocalProxy.
 from flask.ctx import _AppCtxGlobals as ACG # g type.
-from flask.sessions import SecureCookieSession as SCS # session type.
 from social_insecurity import bcrypt # bcrypt object initialized in __init__.py.
 from social_insecurity import sqlite # sqlite object initialized in __init__.py.
+from social_insecurity.session_store import ServerSideSession as SSS # session type.
 from typing import cast
 from werkzeug.local import LocalProxy
 
-# load_user() will validate a cookie session against the SQLite3 database.
+# load_user() will validate a server-side session against the SQLite3 database.
 # acg.user_id is an Application Context Global (ACG) variable. This global
-# variable will indicate if the user has a valid cookie session.
+# variable will indicate if the user has a valid session.
 # acg.user_id is set to None if load_user() failed a check.
 # acg.user_id is set to an integer if load_user() passed all checks.
+# The password was checked once by login_user(), so load_user() only needs a
+# single lookup by primary key.
 def load_user() -> None:
     print("Calling load_user().")
     # pylint: disable=protected-access
@@ -26,49 +28,59 @@ def load_user() -> None:
     acg.user_first_name = None
     acg.user_last_name = None
 
-    # Retrieve login credentials from the Secure Cookie Session (SCS).
-    scs: SCS = cast(LocalProxy[SCS], session)._get_current_object()
-    scs_username: str | None = scs.get(key="username", default=None)
-    scs_password: str | None = scs.get(key="password", default=None)
-    if scs_username is None:
+    # Retrieve the user id from the server-side session.
+    sss: SSS = cast(LocalProxy[SSS], session)._get_current_object()
+    sss_user_id: int | None = sss.get("user_id", None)
+    if sss_user_id is None:
         return None
-    if scs_password is None:
+
+    # Retrieve user data from the SQLite3 database.
+    get_user = """
+        SELECT id, username, first_name, last_name
+        FROM Users
+        WHERE id = ?;
+        """
+    user = sqlite.query(get_user, sss_user_id, one=True)
+    if user is None:
         return None
 
+    # Set the Application Context Globals (ACG) user data variables.
+    acg.user_id = user["id"]
+    acg.user_username = user["username"]
+    acg.user_first_name = user["first_name"]
+    acg.user_last_name = user["last_name"]
+    return None
+
+
+# login_user() will validate login credentials against the SQLite3 database.
+# If the credentials are valid, the session is given a new id and the user id,
+# and load_user() is called to set the Application Context Globals (ACG).
+# The password is never stored in the session.
+def login_user(username: str, password: str) -> None:
+    print("Calling login_user().")
+    # pylint: disable=protected-access
+
+    # Log out of any previous session first.
+    sss: SSS = cast(LocalProxy[SSS], session)._get_current_object()
+    sss.pop("user_id", None)
+
     # Retrieve user data from the SQLite3 database.
     user: dict[str, str | int] | None
     user_id: int | None
-    user_username: str | None
     user_password_hash: str | None
-    user_first_name: str | None
-    user_last_name: str | None
-    user = sqlite.retrieve_user_by_username(username=scs_username)
-    if user is None:
-        return None
-    user_id = cast(int | None, user.get("id", None))
-    user_username = cast(str | None, user.get("username", None))
-    user_password_hash = cast(str | None, user.get("password", None))
-    user_first_name = cast(str | None, user.get("first_name", None))
-    user_last_name = cast(str | None, user.get("last_name", None))
-    if user_id is None:
-        return None
-    if user_username is None:
-        return None
-    if user_password_hash is None:
-        return None
-    if user_first_name is None:
-        return None
-    if user_last_name is None:
-        return None
+    user = sqlite.retrieve_user_by_username(username=username)
+    if user is not None:
+        user_id = cast(int | None, user.get("id", None))
+        user_password_hash = cast(str | None, user.get("password", None))
+
+        # Check the password.
+        if user_id is not None and user_password_hash is not None and bcrypt.check_password_hash(
+            pw_hash=user_password_hash,
+            password=password,
+        ):
+            # A new session id prevents session fixation.
+            sss.regenerate()
+            sss["user_id"] = user_id
 
-    # Check the password.
-    if bcrypt.check_password_hash(
-        pw_hash=user_password_hash,
-        password=scs_password,
-    ):
-        # Set the Application Context Globals (ACG) user data variables.
-        acg.user_id = user_id
-        acg.user_username = user_username
-        acg.user_first_name = user_first_name
-        acg.user_last_name = user_last_name
+    load_user()
     return None
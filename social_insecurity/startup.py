@@ -0,0 +1,67 @@
+"""Provides startup optimizations for the Social Insecurity application.
+
+Compiling the Jinja2 templates is the largest cost of the first requests a new
+worker serves. This file moves that cost to application startup, and caches
+the compiled bytecode on disk so later startups can skip the compiler.
+
+When the application is loaded once and then forked into workers, for example
+with 'gunicorn --preload', prepare_for_fork() makes the warmed state cheap to
+share between the workers.
+
+Example:
+    from social_insecurity import create_app
+    from social_insecurity.startup import prepare_for_fork
+
+    app = create_app()
+    prepare_for_fork(app)
+"""
+
+from __future__ import annotations
+
+import gc
+from pathlib import Path
+
+from flask import Flask, has_app_context
+from jinja2 import FileSystemBytecodeCache
+
+
+def optimize_startup(app: Flask) -> None:
+    """Applies the startup optimizations enabled in the configuration."""
+    if app.config.get("JINJA_BYTECODE_CACHE_PATH"):
+        cache_path = Path(app.instance_path) / app.config["JINJA_BYTECODE_CACHE_PATH"]
+        cache_path.mkdir(parents=True, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(cache_path))
+    if app.config.get("PRECOMPILE_TEMPLATES"):
+        precompile_templates(app)
+
+
+def precompile_templates(app: Flask) -> int:
+    """Compiles all templates into the template cache of the Jinja2 environment.
+
+    returns: The number of compiled templates.
+
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def prepare_for_fork(app: Flask) -> None:
+    """Prepares a fully loaded application to be forked into worker processes.
+
+    The templates are compiled before the fork, so every worker inherits them.
+    The database connections opened while loading are closed, because a
+    SQLite connection must not be used by more than one process. Then all
+    objects are moved out of reach of the garbage collector, which would
+    otherwise touch them in every worker and force the operating system to
+    copy the shared memory pages.
+    """
+    precompile_templates(app)
+    if has_app_context():
+        app.extensions["sqlite3"].close()
+    limiter = app.extensions.get("rate_limiter")
+    if limiter is not None and limiter.store is not None:
+        limiter.store.close()
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,19 @@
+// Replaces the "Load more comments" link with the next page of comment cards.
+// Without JavaScript the link falls back to the full comments page.
+document.addEventListener("click", async (event) => {
+  const link = event.target.closest(".load-more a[data-fragment-url]");
+  if (link === null) {
+    return;
+  }
+  event.preventDefault();
+  const container = link.parentElement;
+  const response = await fetch(link.dataset.fragmentUrl, {
+    credentials: "same-origin",
+  });
+  if (!response.ok) {
+    window.location.href = link.href;
+    return;
+  }
+  container.insertAdjacentHTML("afterend", await response.text());
+  container.remove();
+});
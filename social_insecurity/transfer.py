@@ -0,0 +1,207 @@
+"""Provides bulk export and import of the application data as NDJSON.
+
+Every line of an export is a JSON object holding the name of a table and one
+of its rows:
+
+    {"table": "Users", "row": {"id": 1, "username": "test", ...}}
+
+Both directions are generator pipelines over batches of rows, so memory use
+stays constant no matter how large the database is. In WAL mode the export
+reads all tables in a single read transaction, so it is a consistent snapshot
+even while the application keeps writing. The import inserts the rows with
+executemany() in large transactions. Indexes and triggers on the imported
+tables are dropped for the duration of the load and recreated afterwards,
+which is much faster than updating them row by row. Their SQL is saved in the
+Transfer_deferred table in the same transaction as the drop, so an import
+that is killed midway does not lose them: restore_deferred() recreates them
+on the next import or application start.
+
+Example:
+    from social_insecurity.transfer import export_rows, import_rows
+
+    with open("export.ndjson", "w") as file:
+        file.writelines(export_rows(connection))
+
+    with open("export.ndjson") as file:
+        import_rows(connection, file)
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections.abc import Iterable, Iterator
+from itertools import groupby, islice
+from typing import Any
+
+# The tables in the order they are exported and imported, parents before children.
+TABLES = ("Users", "Posts", "Friends", "Comments")
+
+ON_CONFLICT = ("abort", "ignore", "replace")
+
+# Holds the SQL of the indexes and triggers dropped by an import until they are recreated.
+DEFERRED_TABLE = "Transfer_deferred"
+
+
+def export_rows(conn: sqlite3.Connection, *, batch_size: int = 1000) -> Iterator[str]:
+    """Yields all rows of the application tables as NDJSON lines.
+
+    params:
+        conn: A connection to the database to export.
+        batch_size: The number of rows fetched from the database at a time.
+
+    """
+    # Read all tables from one snapshot, as backup_database() does, so a row never refers to a row
+    # written after its table was exported. WAL mode lets the application keep writing meanwhile.
+    snapshot = conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal" and not conn.in_transaction
+    if snapshot:
+        conn.execute("BEGIN;")
+    try:
+        for table in TABLES:
+            cursor = conn.execute(f"SELECT * FROM [{table}] ORDER BY rowid;")
+            columns = [column[0] for column in cursor.description]
+            try:
+                while rows := cursor.fetchmany(batch_size):
+                    for row in rows:
+                        yield json.dumps({"table": table, "row": dict(zip(columns, row))}, separators=(",", ":")) + "\n"
+            finally:
+                cursor.close()
+    finally:
+        if snapshot:
+            conn.rollback()
+
+
+def import_rows(
+    conn: sqlite3.Connection,
+    lines: Iterable[str],
+    *,
+    batch_size: int = 1000,
+    transaction_size: int = 100_000,
+    on_conflict: str = "abort",
+) -> dict[str, int]:
+    """Inserts NDJSON lines, as created by export_rows(), into the application tables.
+
+    params:
+        conn: A connection to the database to import into.
+        lines: The NDJSON lines.
+        batch_size: The number of rows inserted per executemany() call.
+        transaction_size: The number of rows inserted per transaction.
+        on_conflict: What to do with rows that violate a constraint, one of ON_CONFLICT.
+
+    returns: The number of imported rows per table.
+
+    raises: ValueError if a line names an unknown table or column.
+
+    """
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f"Unknown conflict resolution: {on_conflict}")
+    columns = {table: {info[1] for info in conn.execute(f"PRAGMA table_info([{table}]);")} for table in TABLES}
+    counts = dict.fromkeys(TABLES, 0)
+    restore_deferred(conn)
+    _drop_deferred(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    uncommitted = 0
+    try:
+        conn.execute("BEGIN;")
+        for (table, names), batch in _batches(_records(lines, columns), batch_size):
+            conn.executemany(
+                f"INSERT OR {on_conflict.upper()} INTO [{table}] ({', '.join(f'[{name}]' for name in names)}) "
+                f"VALUES ({', '.join('?' * len(names))});",
+                batch,
+            )
+            counts[table] += len(batch)
+            uncommitted += len(batch)
+            if uncommitted >= transaction_size:
+                conn.execute("COMMIT;")
+                conn.execute("BEGIN;")
+                uncommitted = 0
+        conn.execute("COMMIT;")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.isolation_level = isolation_level
+        restore_deferred(conn)
+    return counts
+
+
+def restore_deferred(conn: sqlite3.Connection) -> int:
+    """Recreates the indexes and triggers dropped by an import, and bumps all version stamps.
+
+    The triggers that maintain the version stamps were not running during the
+    load, so every page must be treated as changed. Does nothing unless an
+    import is finishing or was interrupted.
+
+    returns: The number of recreated indexes and triggers.
+
+    """
+    get_deferred_table = "SELECT COUNT(*) FROM sqlite_master WHERE name = ?;"
+    if not conn.execute(get_deferred_table, (DEFERRED_TABLE,)).fetchone()[0]:
+        return 0
+    # Several worker processes may start at once, so only the first one to take the write lock restores.
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        if not conn.execute(get_deferred_table, (DEFERRED_TABLE,)).fetchone()[0]:
+            conn.rollback()
+            return 0
+        deferred = [row[0] for row in conn.execute(f"SELECT sql FROM [{DEFERRED_TABLE}] ORDER BY rowid;")]
+        for sql in deferred:
+            conn.execute(sql)
+        if conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'Versions';").fetchone()[0]:
+            for scope, table in (("user", "Users"), ("profile", "Users"), ("post", "Posts")):
+                conn.execute(
+                    f"INSERT INTO Versions (scope, [key]) SELECT '{scope}', id FROM [{table}] WHERE true "
+                    "ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1;"
+                )
+        conn.execute(f"DROP TABLE [{DEFERRED_TABLE}];")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(deferred)
+
+
+def _records(lines: Iterable[str], columns: dict[str, set[str]]) -> Iterator[tuple[str, tuple[str, ...], tuple]]:
+    """Parses NDJSON lines into (table, column names, values) records."""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        record: dict[str, Any] = json.loads(line)
+        table, row = record["table"], record["row"]
+        if table not in columns:
+            raise ValueError(f"Line {number}: Unknown table {table}")
+        names = tuple(row)
+        if not columns[table].issuperset(names):
+            raise ValueError(f"Line {number}: Unknown columns in table {table}: {set(names) - columns[table]}")
+        yield table, names, tuple(row.values())
+
+
+def _batches(
+    records: Iterator[tuple[str, tuple[str, ...], tuple]], batch_size: int
+) -> Iterator[tuple[tuple[str, tuple[str, ...]], list[tuple]]]:
+    """Groups consecutive records with the same table and columns into batches of values."""
+    for key, group in groupby(records, key=lambda record: record[:2]):
+        values = (record[2] for record in group)
+        while batch := list(islice(values, batch_size)):
+            yield key, batch
+
+
+def _drop_deferred(conn: sqlite3.Connection) -> None:
+    """Drops the indexes and triggers on the application tables, and saves their SQL in DEFERRED_TABLE."""
+    conn.execute("BEGIN;")
+    try:
+        rows = conn.execute(
+            f"SELECT name, type, sql FROM sqlite_master "
+            f"WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({', '.join('?' * len(TABLES))});",
+            TABLES,
+        ).fetchall()
+        conn.execute(f"CREATE TABLE [{DEFERRED_TABLE}](sql TEXT NOT NULL);")
+        conn.executemany(f"INSERT INTO [{DEFERRED_TABLE}] (sql) VALUES (?);", [(sql,) for _, _, sql in rows])
+        for name, type_, _ in rows:
+            conn.execute(f"DROP {type_.upper()} [{name}];")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
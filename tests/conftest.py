@@ -0,0 +1,166 @@
+"""Provides the test fixtures for the Social Insecurity application.
+
+A seeded template database is built once per test session, or once per worker
+when the tests run in parallel with 'pytest -n auto'. Every test then gets a
+fresh copy of it, restored with the SQLite online backup API into a shared
+in-memory database. The copy only takes a few milliseconds, so every test can
+start from the full dataset without rebuilding it.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+from flask_bcrypt import Bcrypt
+
+from social_insecurity import create_app, profiles
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask.testing import FlaskClient
+    from werkzeug.test import TestResponse
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "social_insecurity" / "schema.sql"
+
+# The seeded users as (username, first_name, last_name, password).
+USERS = [
+    ("alice", "Alice", "Smith", "password1"),
+    ("bob", "Bob", "Jones", "password2"),
+    ("carol", "Carol", "White", "password3"),
+    ("dave", "Dave", "Brown", "password4"),
+]
+# Alice is friends with Bob and Carol. Dave has no friends.
+FRIENDS = [("alice", "bob"), ("alice", "carol")]
+POSTS_PER_USER = 3
+COMMENTS_ON_FIRST_POST = 5
+
+
+def seed(connection: sqlite3.Connection) -> None:
+    """Seeds a database created from schema.sql with the test dataset."""
+    bcrypt = Bcrypt()
+    connection.executemany(
+        "INSERT INTO Users (username, first_name, last_name, password) VALUES (?, ?, ?, ?);",
+        [
+            (username, first_name, last_name, bcrypt.generate_password_hash(password, rounds=4).decode("utf-8"))
+            for username, first_name, last_name, password in USERS
+        ],
+    )
+    user_ids = dict(connection.execute("SELECT username, id FROM Users;").fetchall())
+    connection.executemany(
+        "INSERT INTO Friends (u_id, f_id) VALUES (?, ?);",
+        [(user_ids[username], user_ids[friend]) for username, friend in FRIENDS],
+    )
+    connection.executemany(
+        "INSERT INTO Posts (u_id, content, image, creation_time) VALUES (?, ?, '', datetime('now', ?));",
+        [
+            (user_ids[username], f"Post number {i} by {username}", f"-{len(USERS) * i + n} minutes")
+            for i in range(POSTS_PER_USER)
+            for n, (username, *_) in enumerate(USERS)
+        ],
+    )
+    first_post = connection.execute("SELECT MIN(id) FROM Posts;").fetchone()[0]
+    connection.executemany(
+        "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, ?, ?, datetime('now', ?));",
+        [
+            (first_post, user_ids["bob"], f"Comment number {i}", f"-{COMMENTS_ON_FIRST_POST - i} seconds")
+            for i in range(COMMENTS_ON_FIRST_POST)
+        ],
+    )
+    connection.commit()
+
+
+@pytest.fixture(scope="session")
+def template_database(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    path = tmp_path_factory.mktemp("database") / "template.db"
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA_PATH.read_text())
+        seed(connection)
+    finally:
+        connection.close()
+    return path
+
+
+@pytest.fixture(scope="session")
+def database_uri() -> str:
+    # Each xdist worker is a separate process, the name only keeps the workers apart in logs.
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+    return f"file:social_insecurity_test_{worker}?mode=memory&cache=shared"
+
+
+@pytest.fixture(scope="session")
+def app(database_uri: str) -> Iterator[Flask]:
+    test_config = {
+        "SQLITE3_DATABASE_PATH": database_uri,
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "BCRYPT_LOG_ROUNDS": 4,
+        "RATELIMIT_ENABLED": False,
+        # The tests must not write into the instance folder of the working tree.
+        "JINJA_BYTECODE_CACHE_PATH": None,
+    }
+    app = create_app(test_config)
+    yield app
+
+
+@pytest.fixture(autouse=True)
+def database(app: Flask, template_database: Path, database_uri: str) -> Iterator[sqlite3.Connection]:
+    # The in-memory database lives as long as this connection is open.
+    connection = sqlite3.connect(database_uri, uri=True)
+    template = sqlite3.connect(template_database)
+    try:
+        template.backup(connection)
+    finally:
+        template.close()
+    # Cached profiles belong to the previous copy.
+    profiles.clear()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture()
+def file_database_path(template_database: Path, tmp_path: Path) -> Path:
+    # For the tests that need a database on disk, e.g. for WAL mode or a second connection.
+    path = tmp_path / "sqlite3.db"
+    connection = sqlite3.connect(path)
+    template = sqlite3.connect(template_database)
+    try:
+        template.backup(connection)
+    finally:
+        template.close()
+        connection.close()
+    return path
+
+
+@pytest.fixture()
+def file_database(file_database_path: Path) -> Iterator[sqlite3.Connection]:
+    connection = sqlite3.connect(file_database_path)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture()
+def client(app: Flask) -> FlaskClient:
+    return app.test_client()
+
+
+@pytest.fixture()
+def login(client: FlaskClient) -> Callable[[str], TestResponse]:
+    passwords = {username: password for username, _, _, password in USERS}
+
+    def login(username: str) -> TestResponse:
+        return client.post(
+            "/",
+            data={
+                "login-username": username,
+                "login-password": passwords[username],
+                "login-submit": "Sign In",
+            },
+        )
+
+    return login
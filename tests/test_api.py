@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from flask.testing import FlaskClient
+    from werkzeug.test import TestResponse
+
+
+def test_api_feed(client: FlaskClient):
+    response = client.get("/api/v1/feed/alice")
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    assert set(response.json) == {"items", "next_cursor"}
+
+
+def test_api_feed_conditional_get(client: FlaskClient):
+    response = client.get("/api/v1/feed/alice")
+    assert response.headers["ETag"]
+    response = client.get("/api/v1/feed/alice", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_api_feed_unknown_user(client: FlaskClient):
+    response = client.get("/api/v1/feed/nobody")
+    assert response.status_code == 404
+    assert "error" in response.json
+
+
+def test_api_feed_invalid_cursor(client: FlaskClient):
+    response = client.get("/api/v1/feed/alice?cursor=!")
+    assert response.status_code == 400
+
+
+def test_api_post_unknown(client: FlaskClient):
+    response = client.get("/api/v1/posts/0")
+    assert response.status_code == 404
+
+
+def test_api_profile_requires_login(client: FlaskClient):
+    response = client.get("/api/v1/profile/alice")
+    assert response.status_code == 401
+    assert response.json == {"error": "Not logged in."}
+
+
+def test_api_feed_pages(client: FlaskClient):
+    response = client.get("/api/v1/feed/alice?limit=4")
+    first = response.json
+    assert len(first["items"]) == 4
+    response = client.get(f"/api/v1/feed/alice?limit=4&cursor={first['next_cursor']}")
+    second = response.json
+    assert len(second["items"]) == 4
+    response = client.get(f"/api/v1/feed/alice?limit=4&cursor={second['next_cursor']}")
+    third = response.json
+    assert len(third["items"]) == 1
+    assert third["next_cursor"] is None
+    assert all(item["username"] in ("alice", "bob", "carol") for item in first["items"] + second["items"])
+
+
+def test_api_post_comments(client: FlaskClient):
+    response = client.get("/api/v1/posts/1?limit=2")
+    assert response.status_code == 200
+    assert response.json["post"]["id"] == 1
+    assert [comment["comment"] for comment in response.json["comments"]["items"]] == [
+        "Comment number 4",
+        "Comment number 3",
+    ]
+
+
+def test_api_post_comments_without_creation_time(client: FlaskClient, database: sqlite3.Connection):
+    database.executemany(
+        "INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, ?);", [(f"Undated {i}",) for i in range(3)]
+    )
+    database.commit()
+    comments = []
+    url = "/api/v1/posts/1?limit=2"
+    while url:
+        page = client.get(url).json["comments"]
+        comments += [comment["comment"] for comment in page["items"]]
+        url = page["next_cursor"] and f"/api/v1/posts/1?limit=2&cursor={page['next_cursor']}"
+    assert len(comments) == 8
+    assert comments[5:] == ["Undated 2", "Undated 1", "Undated 0"]
+
+
+def test_api_profile(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    response = client.get("/api/v1/profile/alice")
+    assert response.status_code == 200
+    assert response.json["first_name"] == "Alice"
+    assert "password" not in response.json
+
+
+def test_api_friends(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    response = client.get("/api/v1/friends/alice")
+    assert [friend["username"] for friend in response.json["items"]] == ["bob", "carol"]
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from social_insecurity import backup
+from social_insecurity.backup import backup_database, create_snapshot, list_snapshots, prune_snapshots
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+def test_backup_database(database: sqlite3.Connection, tmp_path: Path):
+    destination = tmp_path / "copy.db"
+    pages = backup_database(database, destination, pages=1, pause=0)
+    assert pages > 1
+    copy = sqlite3.connect(destination)
+    try:
+        assert copy.execute("SELECT username FROM Users ORDER BY id;").fetchall() == database.execute(
+            "SELECT username FROM Users ORDER BY id;"
+        ).fetchall()
+    finally:
+        copy.close()
+    assert not destination.with_name("copy.db.partial").exists()
+
+
+def test_backup_database_with_concurrent_writer(file_database_path: Path, tmp_path: Path):
+    source = sqlite3.connect(file_database_path)
+    source.execute("PRAGMA journal_mode = WAL;")
+    source.executemany("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, ?);", [("x" * 1000,)] * 200)
+    source.commit()
+
+    done = threading.Event()
+    writes = 0
+
+    def write() -> None:
+        nonlocal writes
+        writer = sqlite3.connect(file_database_path)
+        while not done.is_set():
+            writer.execute("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, 'new');")
+            writer.commit()
+            writes += 1
+        writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        backup_database(source, tmp_path / "copy.db", pages=4, pause=0.001)
+    finally:
+        done.set()
+        thread.join()
+        source.close()
+    assert writes > 0
+    copy = sqlite3.connect(tmp_path / "copy.db")
+    assert copy.execute("PRAGMA integrity_check;").fetchone()[0] == "ok"
+    copy.close()
+
+
+def test_snapshots_store_uploads_once(database: sqlite3.Connection, tmp_path: Path):
+    uploads_path = tmp_path / "uploads"
+    uploads_path.mkdir()
+    (uploads_path / "a.png").write_bytes(b"image")
+    (uploads_path / "b.png").write_bytes(b"image")
+    backup_path = tmp_path / "backups"
+
+    first = create_snapshot(database, uploads_path, backup_path, pause=0)
+    assert (first.uploads, first.uploads_copied, first.uploads_hashed) == (2, 1, 2)
+
+    (uploads_path / "c.png").write_bytes(b"other image")
+    second = create_snapshot(database, uploads_path, backup_path, pause=0)
+    assert (second.uploads, second.uploads_copied, second.uploads_hashed) == (3, 1, 1)
+    assert len(list((backup_path / "objects").glob("*/*"))) == 2
+
+
+def test_prune_snapshots(database: sqlite3.Connection, tmp_path: Path):
+    uploads_path = tmp_path / "uploads"
+    uploads_path.mkdir()
+    backup_path = tmp_path / "backups"
+    (uploads_path / "old.png").write_bytes(b"old image")
+    create_snapshot(database, uploads_path, backup_path, pause=0)
+    (uploads_path / "old.png").unlink()
+    latest = create_snapshot(database, uploads_path, backup_path, pause=0)
+
+    assert prune_snapshots(backup_path, keep=1) == 1
+    assert list_snapshots(backup_path) == [latest.path]
+    assert list((backup_path / "objects").glob("*/*")) == []
+
+
+def test_failed_snapshot_is_removed(database: sqlite3.Connection, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(backup, "snapshot_uploads", fail)
+    backup_path = tmp_path / "backups"
+    with pytest.raises(OSError):
+        create_snapshot(database, tmp_path / "uploads", backup_path, pause=0)
+    assert list((backup_path / "snapshots").iterdir()) == []
+
+
+def test_backup_command(app: Flask, tmp_path: Path):
+    result = app.test_cli_runner().invoke(args=["backup", "--destination", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Backup: Created snapshot" in result.output
+    assert len(list_snapshots(tmp_path)) == 1
+
+
+def test_backup_command_keep_zero(app: Flask, tmp_path: Path):
+    result = app.test_cli_runner().invoke(args=["backup", "--destination", str(tmp_path), "--keep", "0"])
+    assert result.exit_code == 0
+    assert "pruned 1 old snapshots" in result.output
+    assert list_snapshots(tmp_path) == []
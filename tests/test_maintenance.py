@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from social_insecurity import maintenance
+from social_insecurity.maintenance import SESSIONS_BATCH_SIZE, _Interrupted, checkpoint, sessions, vacuum
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+@pytest.fixture()
+def bloated_database(file_database: sqlite3.Connection) -> sqlite3.Connection:
+    file_database.execute("PRAGMA journal_mode = WAL;")
+    file_database.executemany("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, ?);", [("x" * 1000,)] * 500)
+    file_database.execute("DELETE FROM Comments;")
+    file_database.commit()
+    return file_database
+
+
+def test_vacuum_frees_pages(bloated_database: sqlite3.Connection):
+    assert bloated_database.execute("PRAGMA freelist_count;").fetchone()[0] > 0
+    metrics = vacuum(bloated_database, time.monotonic() + 10, "PASSIVE")
+    assert metrics["pages_freed"] > 0
+    assert bloated_database.execute("PRAGMA freelist_count;").fetchone()[0] == 0
+
+
+def test_vacuum_stops_at_deadline(bloated_database: sqlite3.Connection):
+    with pytest.raises(_Interrupted) as excinfo:
+        vacuum(bloated_database, time.monotonic() - 1, "PASSIVE")
+    assert excinfo.value.metrics["pages_freed"] == 0
+
+
+def test_checkpoint(bloated_database: sqlite3.Connection):
+    metrics = checkpoint(bloated_database, time.monotonic() + 10, "TRUNCATE")
+    assert metrics["mode"] == "truncate"
+    assert metrics["log_frames"] == metrics["checkpointed_frames"]
+
+
+def test_sessions_deletes_expired_sessions_in_batches(database: sqlite3.Connection):
+    expired = [(i.to_bytes(16, "big"), 1, 0, None) for i in range(SESSIONS_BATCH_SIZE * 2 + 1)]
+    database.executemany("INSERT INTO Sessions (id, user_id, expires, [data]) VALUES (?, ?, ?, ?);", expired)
+    database.execute("INSERT INTO Sessions (id, user_id, expires) VALUES (x'ff', 1, ?);", (int(time.time()) + 60,))
+    database.commit()
+    metrics = sessions(database, time.monotonic() + 10, "PASSIVE")
+    assert metrics["sessions_deleted"] == len(expired)
+    assert database.execute("SELECT id FROM Sessions;").fetchall() == [(b"\xff",)]
+
+
+def test_run_reports_results(app: Flask):
+    results = maintenance.run(budget=1.0)
+    assert [result.name for result in results] == ["optimize", "vacuum", "sessions", "checkpoint"]
+    assert results[0].status == "completed"
+    assert results[2].status == "completed"
+    # The test database lives in memory, which has no write-ahead log.
+    assert results[3].status == "skipped"
+    assert list(maintenance.history)[-4:] == results
+
+
+def test_maintenance_command(app: Flask):
+    result = app.test_cli_runner().invoke(args=["maintenance", "--task", "optimize"])
+    assert result.exit_code == 0
+    assert "Maintenance: optimize completed" in result.output
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+import pytest
+
+from social_insecurity import profiles
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask.testing import FlaskClient
+    from werkzeug.test import TestResponse
+
+PROFILE = {
+    "education": "University",
+    "employment": "Engineer",
+    "music": "Jazz",
+    "movie": "Alien",
+    "nationality": "Norwegian",
+    "birthday": "1990-01-01",
+}
+
+
+def user_id(database: sqlite3.Connection, username: str) -> int:
+    return database.execute("SELECT id FROM Users WHERE username = ?;", (username,)).fetchone()[0]
+
+
+def test_profile_is_cached(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    assert client.get("/profile/alice").status_code == 200
+    assert client.get("/profile/alice").status_code == 200
+    assert profiles.stats()["misses"] == 1
+    assert profiles.stats()["hits"] == 1
+
+
+def test_profile_page_hit_reads_no_extra_query(
+    client: FlaskClient, login: Callable[[str], TestResponse], monkeypatch: pytest.MonkeyPatch
+):
+    login("alice")
+
+    def version(*args, **kwargs):
+        raise AssertionError("The profile counter was read again.")
+
+    monkeypatch.setattr(profiles, "_version", version)
+    assert client.get("/profile/alice").status_code == 200
+
+    def query_dicts(*args, **kwargs):
+        raise AssertionError("The profile was read from the database.")
+
+    monkeypatch.setattr(profiles._sqlite, "query_dicts", query_dicts)
+    assert client.get("/profile/alice").status_code == 200
+    assert profiles.stats()["hits"] == 1
+
+
+def test_update_profile_invalidates(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    client.get("/profile/alice")
+    response = client.post("/profile/alice", data={**PROFILE, "submit": "Update Profile"})
+    assert response.status_code == 302
+    assert profiles.stats()["invalidations"] == 1
+    assert b"Alien" in client.get("/profile/alice").data
+
+
+def test_update_by_another_process_invalidates(app: Flask, database: sqlite3.Connection):
+    alice = user_id(database, "alice")
+    with app.app_context():
+        assert profiles.get(alice)["movie"] == "Unknown"
+        # A write that does not touch the profile fields keeps the entry.
+        database.execute("UPDATE Users SET password = 'x' WHERE id = ?;", (alice,))
+        database.commit()
+        assert profiles.get(alice)["movie"] == "Unknown"
+        assert profiles.stats()["hits"] == 1
+        database.execute("UPDATE Users SET movie = 'Alien' WHERE id = ?;", (alice,))
+        database.commit()
+        assert profiles.get(alice)["movie"] == "Alien"
+        assert profiles.stats()["misses"] == 2
+
+
+def test_least_recently_used_profile_is_evicted(
+    app: Flask, database: sqlite3.Connection, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(profiles, "_max_size", 2)
+    alice, bob, carol = (user_id(database, username) for username in ("alice", "bob", "carol"))
+    with app.app_context():
+        profiles.get(alice)
+        profiles.get(bob)
+        profiles.get(alice)
+        profiles.get(carol)
+        assert profiles.stats()["evictions"] == 1
+        profiles.get(alice)
+        assert profiles.stats()["hits"] == 2
+        profiles.get(bob)
+        assert profiles.stats()["misses"] == 4
+
+
+def test_profile_cache_stats_endpoint(client: FlaskClient, login: Callable[[str], TestResponse]):
+    assert client.get("/api/v1/stats/profile-cache").status_code == 401
+    login("alice")
+    client.get("/api/v1/profile/alice")
+    client.get("/api/v1/profile/alice")
+    response = client.get("/api/v1/stats/profile-cache")
+    assert response.status_code == 200
+    assert response.json["hits"] == 1
+    assert response.json["misses"] == 1
+    assert response.json["hit_ratio"] == 0.5
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+from werkzeug.exceptions import TooManyRequests
+
+from social_insecurity import bcrypt, limiter, trust_proxies
+from social_insecurity.ratelimit import MemoryBucketStore, SQLiteBucketStore
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask.testing import FlaskClient
+
+
+@pytest.fixture()
+def rate_limited(app: Flask, monkeypatch: pytest.MonkeyPatch) -> Iterator[Flask]:
+    assert limiter.store is not None
+    limiter.store.clear()
+    monkeypatch.setitem(app.config, "RATELIMIT_ENABLED", True)
+    yield app
+    limiter.store.clear()
+
+
+def test_memory_store_burst():
+    store = MemoryBucketStore()
+    assert [store.take("key", 1.0, 3, 1.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("key", 1.0, 3, 1.0) > 0
+    assert store.take("other", 1.0, 3, 1.0) == 0.0
+
+
+def test_memory_store_refill(monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr("social_insecurity.ratelimit.time.monotonic", lambda: now)
+    store = MemoryBucketStore()
+    store.take("key", 0.5, 1, 1.0)
+    assert store.take("key", 0.5, 1, 1.0) == pytest.approx(2.0)
+    now += 2.0
+    assert store.take("key", 0.5, 1, 1.0) == 0.0
+    # A full bucket is not stored.
+    now += 2.0
+    store.take("key", 0.5, 1, 1.0, consume=False)
+    assert len(store) == 0
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryBucketStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        store.take(key, 1.0, 1, 1.0)
+    assert len(store) == 2
+    assert store.take("a", 1.0, 1, 1.0) == 0.0
+    assert store.take("c", 1.0, 1, 1.0) > 0
+
+
+def test_refund_is_capped_at_burst(tmp_path: Path):
+    for store in (MemoryBucketStore(), SQLiteBucketStore(tmp_path / "ratelimit.db")):
+        store.take("key", 0.001, 2, 1.0)
+        store.refund("key", 0.001, 2, 1.0)
+        store.refund("key", 0.001, 2, 1.0)
+        assert store.take("key", 0.001, 2, 1.0) == 0.0
+        assert store.take("key", 0.001, 2, 1.0) == 0.0
+        assert store.take("key", 0.001, 2, 1.0) > 0
+
+
+def test_sqlite_store_is_shared(tmp_path: Path):
+    store = SQLiteBucketStore(tmp_path / "ratelimit.db")
+    other = SQLiteBucketStore(tmp_path / "ratelimit.db")
+    assert store.take("key", 1.0, 2, 1.0) == 0.0
+    assert other.take("key", 1.0, 2, 1.0) == 0.0
+    assert store.take("key", 1.0, 2, 1.0) > 0
+    other.clear()
+    assert store.take("key", 1.0, 2, 1.0) == 0.0
+
+
+def test_sqlite_store_fails_closed_when_locked(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(SQLiteBucketStore, "busy_timeout", 0.01)
+    store = SQLiteBucketStore(tmp_path / "ratelimit.db")
+    other = SQLiteBucketStore(tmp_path / "ratelimit.db")
+    lock = other._connection()
+    lock.execute("BEGIN IMMEDIATE;")
+    try:
+        assert store.take("key", 1.0, 2, 1.0) == SQLiteBucketStore.busy_wait
+        store.refund("key", 1.0, 2, 1.0)
+    finally:
+        lock.execute("ROLLBACK;")
+    assert store.take("key", 1.0, 2, 1.0) == 0.0
+
+
+def test_failed_logins_are_throttled_before_hashing(
+    rate_limited: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setitem(rate_limited.config, "RATELIMIT_USERNAME_BURST", 2)
+    checks = 0
+    check_password_hash = bcrypt.check_password_hash
+
+    def counting_check_password_hash(*args, **kwargs):
+        nonlocal checks
+        checks += 1
+        return check_password_hash(*args, **kwargs)
+
+    monkeypatch.setattr(bcrypt, "check_password_hash", counting_check_password_hash)
+    data = {"login-username": "alice", "login-password": "wrong", "login-submit": "Sign In"}
+    assert client.post("/", data=data).status_code == 200
+    assert client.post("/", data=data).status_code == 200
+    response = client.post("/", data=data)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert checks == 2
+
+
+def test_concurrent_logins_reserve_username_tokens(rate_limited: Flask, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(rate_limited.config, "RATELIMIT_USERNAME_BURST", 2)
+    # Attempts from different addresses whose passwords are still being checked.
+    for address in ("192.0.2.1", "192.0.2.2"):
+        with rate_limited.test_request_context("/", environ_base={"REMOTE_ADDR": address}):
+            limiter.limit_login("alice")
+    with rate_limited.test_request_context("/", environ_base={"REMOTE_ADDR": "192.0.2.3"}):
+        with pytest.raises(TooManyRequests):
+            limiter.limit_login("alice")
+        limiter.record_success("alice")
+        limiter.limit_login("alice")
+
+
+def test_successful_logins_are_not_throttled(rate_limited: Flask, login, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(rate_limited.config, "RATELIMIT_USERNAME_BURST", 1)
+    assert login("alice").status_code == 302
+    assert login("alice").status_code == 302
+
+
+def test_logins_are_throttled_per_ip(rate_limited: Flask, login, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(rate_limited.config, "RATELIMIT_IP_BURST", 1)
+    assert login("alice").status_code == 302
+    assert login("bob").status_code == 429
+
+
+def test_trusted_proxy_hops(rate_limited: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(rate_limited.config, "RATELIMIT_IP_BURST", 1)
+    monkeypatch.setitem(rate_limited.config, "TRUSTED_PROXY_HOPS", 1)
+    monkeypatch.setattr(rate_limited, "wsgi_app", rate_limited.wsgi_app)
+    trust_proxies(rate_limited)
+
+    def attempt(address: str) -> int:
+        data = {"login-username": "alice", "login-password": "wrong", "login-submit": "Sign In"}
+        return client.post("/", data=data, headers={"X-Forwarded-For": address}).status_code
+
+    assert attempt("192.0.2.1") == 200
+    assert attempt("192.0.2.2") == 200
+    assert attempt("192.0.2.1") == 429
@@ -1,33 +1,193 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
 from typing import TYPE_CHECKING
 
 import pytest
+from flask import Flask
 
-from social_insecurity import create_app
+from social_insecurity import sqlite
+from social_insecurity.conditional import VersionStamps
+from social_insecurity.database import SQLite3
+from social_insecurity.pagination import PAGINATION_INDEXES
 
 if TYPE_CHECKING:
-    from flask import Flask
     from flask.testing import FlaskClient
+    from werkzeug.test import TestResponse
 
 
-@pytest.fixture(scope="session")
-def app() -> Iterator[Flask]:
-    test_config = {
-        "SQLITE3_DATABASE_PATH": "file::memory:?cache=shared",
-        "TESTING": True,
-        "WTF_CSRF_ENABLED": False,
-    }
-    app = create_app(test_config)
-    yield app
+def test_request_index(client: FlaskClient):
+    response = client.get("/")
+    assert response.status_code == 200
 
 
-@pytest.fixture()
-def client(app: Flask) -> FlaskClient:
-    return app.test_client()
+def test_stream_conditional_get(app: Flask, client: FlaskClient):
+    response = client.get("/stream/test")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" not in response.headers
 
+    response = client.get("/stream/test", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
 
-def test_request_index(client: FlaskClient):
-    response = client.get("/")
+    with app.app_context():
+        sqlite.query("INSERT INTO Posts (u_id, content, creation_time) VALUES (1, 'New post', CURRENT_TIMESTAMP);")
+    response = client.get("/stream/test", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_stream_ignores_if_modified_since(client: FlaskClient):
+    # A date can not tell a write within the same second, or a new CSRF token, from an unchanged page.
+    response = client.get("/stream/test", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
+
+
+def test_existing_database_is_upgraded(file_database_path: Path):
+    # A database created before the indexes, the Versions table and its triggers were added to schema.sql.
+    connection = sqlite3.connect(file_database_path)
+    for type_, name in connection.execute(
+        "SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL;"
+    ).fetchall():
+        connection.execute(f"DROP {type_.upper()} [{name}];")
+    connection.execute("DROP TABLE Versions;")
+    connection.commit()
+
+    app = Flask(__name__, instance_path=str(file_database_path.parent))
+    app.config["SQLITE3_DATABASE_PATH"] = file_database_path.name
+    database = SQLite3(app, schema="schema.sql")
+    database.executescript(PAGINATION_INDEXES)
+    VersionStamps(app, database)
+    names = {row[0] for row in connection.execute("SELECT name FROM sqlite_master;")}
+    connection.close()
+    assert {"Versions", "Users_profile_version", "Comments_insert_version"} <= names
+    assert {"Posts_creation_time", "Comments_p_id_sort_time"} <= names
+
+
+def test_versions_modified_time_is_dropped(file_database_path: Path):
+    connection = sqlite3.connect(file_database_path)
+    connection.executescript(
+        """
+        DROP TABLE Versions;
+        DROP TRIGGER Comments_insert_version;
+        CREATE TABLE Versions(
+          scope VARCHAR NOT NULL, [key] INTEGER NOT NULL, counter INTEGER NOT NULL DEFAULT 1,
+          [modified_time] DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (scope, [key])
+        ) WITHOUT ROWID;
+        CREATE TRIGGER Comments_insert_version AFTER INSERT ON Comments
+        BEGIN
+          INSERT INTO Versions (scope, [key]) VALUES ('post', NEW.p_id)
+          ON CONFLICT (scope, [key]) DO UPDATE SET counter = counter + 1, modified_time = CURRENT_TIMESTAMP;
+        END;
+        """
+    )
+
+    app = Flask(__name__, instance_path=str(file_database_path.parent))
+    app.config["SQLITE3_DATABASE_PATH"] = file_database_path.name
+    VersionStamps(app, SQLite3(app))
+    assert "modified_time" not in {row[1] for row in connection.execute("PRAGMA table_info(Versions);")}
+    connection.execute("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, 'New');")
+    connection.execute("INSERT INTO Comments (p_id, u_id, comment) VALUES (1, 1, 'Newer');")
+    assert connection.execute("SELECT counter FROM Versions WHERE scope = 'post' AND key = 1;").fetchone() == (2,)
+    connection.close()
+
+
+def test_comments_pagination(app: Flask, client: FlaskClient):
+    page_size = app.config["COMMENTS_PAGE_SIZE"]
+    with app.app_context():
+        sqlite.query("INSERT INTO Posts (u_id, content, creation_time) VALUES (1, 'Paged', CURRENT_TIMESTAMP);")
+        post_id = sqlite.query("SELECT MAX(id) AS id FROM Posts;", one=True)["id"]
+        for i in range(page_size + 5):
+            sqlite.query(
+                "INSERT INTO Comments (p_id, u_id, comment, creation_time) VALUES (?, 1, ?, CURRENT_TIMESTAMP);",
+                post_id,
+                f"Comment number {i}",
+            )
+
+    response = client.get(f"/comments/test/{post_id}")
+    assert response.status_code == 200
+    assert response.data.count(b"Comment number") == page_size
+    assert b"Comment number 0<" not in response.data
+    assert b"Load more comments" in response.data
+
+    fragment_url = response.data.split(b"data-fragment-url=")[1].split(b">")[0].decode().replace("&amp;", "&")
+    response = client.get(fragment_url)
     assert response.status_code == 200
+    assert response.data.count(b"Comment number") == 5
+    assert b"Comment number 0<" in response.data
+    assert b"Load more comments" not in response.data
+
+
+def test_login(login: Callable[[str], TestResponse]):
+    response = login("alice")
+    assert response.status_code == 302
+    assert response.headers["Location"] == "/stream/alice"
+
+
+def test_stream_shows_friends_posts(client: FlaskClient):
+    response = client.get("/stream/alice")
+    assert response.status_code == 200
+    assert b"Post number 0 by bob" in response.data
+    assert b"Post number 0 by carol" in response.data
+    assert b"by dave" not in response.data
+
+
+def test_profile_requires_login(client: FlaskClient):
+    response = client.get("/profile/alice")
+    assert response.status_code == 401
+
+
+def test_profile(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    response = client.get("/profile/alice")
+    assert response.status_code == 200
+    assert b"Alice Smith" in response.data
+
+
+def test_add_friend(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("dave")
+    response = client.post("/friends/dave", data={"username": "alice"})
+    assert response.status_code == 200
+    assert b"Friend successfully added!" in response.data
+    assert b">alice</a>" in response.data
+
+
+def test_stream_is_streamed(app: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch):
+    # A streamed response has no Content-Length, the size is unknown when the headers are sent.
+    response = client.get("/stream/alice")
+    assert "Content-Length" not in response.headers
+    streamed = response.get_data()
+
+    monkeypatch.setitem(app.config, "STREAM_FEED", False)
+    response = client.get("/stream/alice")
+    assert "Content-Length" in response.headers
+    assert response.get_data() == streamed
+
+
+def test_stream_reads_posts_in_batches(app: Flask, database: sqlite3.Connection):
+    get_first = "SELECT id, creation_time FROM Posts ORDER BY creation_time DESC, id DESC LIMIT :limit;"
+    get_next = """
+        SELECT id, creation_time FROM Posts
+        WHERE (creation_time, id) < (:creation_time, :id)
+        ORDER BY creation_time DESC, id DESC
+        LIMIT :limit;
+        """
+    expected = database.execute("SELECT id FROM Posts ORDER BY creation_time DESC, id DESC;").fetchall()
+    with app.app_context():
+        posts = sqlite.iterate(get_first, get_next, {}, batch_size=2)
+        first = next(posts)
+        # The batch was read by a finished query, so a writer is not blocked by the reader.
+        database.execute("UPDATE Posts SET content = 'Edited' WHERE id = ?;", (first["id"],))
+        database.commit()
+        assert [first["id"], *(post["id"] for post in posts)] == [row[0] for row in expected]
+
+
+def test_stream_shows_flashed_message_once(client: FlaskClient, login: Callable[[str], TestResponse]):
+    login("alice")
+    response = client.get("/stream/alice")
+    assert b"You are logged in as alice" in response.data
+    response = client.get("/stream/alice")
+    assert b"You are logged in as alice" not in response.data
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+import pytest
+
+from social_insecurity import bcrypt
+from social_insecurity.session_store import _key
+
+if TYPE_CHECKING:
+    from flask.testing import FlaskClient
+    from werkzeug.test import TestResponse
+
+
+def session_id(client: FlaskClient) -> str:
+    cookie = client.get_cookie("session")
+    assert cookie is not None
+    return cookie.value
+
+
+def test_no_session_is_stored_for_anonymous_requests(client: FlaskClient, database: sqlite3.Connection):
+    response = client.get("/")
+    assert "Set-Cookie" not in response.headers
+    assert database.execute("SELECT COUNT(*) FROM Sessions;").fetchone()[0] == 0
+
+
+def test_login_stores_user_id_on_the_server(
+    client: FlaskClient, login: Callable[[str], TestResponse], database: sqlite3.Connection
+):
+    login("alice")
+    cookie = session_id(client)
+    assert len(cookie) == 22
+    user_id, data = database.execute(
+        "SELECT user_id, [data] FROM Sessions WHERE id = ?;", (_key(cookie),)
+    ).fetchone()
+    assert user_id == database.execute("SELECT id FROM Users WHERE username = 'alice';").fetchone()[0]
+    assert b"password" not in (data or b"")
+
+
+def test_requests_do_not_check_the_password(
+    client: FlaskClient, login: Callable[[str], TestResponse], monkeypatch: pytest.MonkeyPatch
+):
+    login("alice")
+
+    def check_password_hash(*args, **kwargs):
+        raise AssertionError("The password was checked again.")
+
+    monkeypatch.setattr(bcrypt, "check_password_hash", check_password_hash)
+    assert client.get("/profile/alice").status_code == 200
+
+
+def test_login_regenerates_the_session_id(
+    client: FlaskClient, login: Callable[[str], TestResponse], database: sqlite3.Connection
+):
+    login("alice")
+    first = session_id(client)
+    login("bob")
+    second = session_id(client)
+    assert first != second
+    assert database.execute("SELECT id FROM Sessions;").fetchall() == [(_key(second),)]
+    assert client.get("/profile/bob").status_code == 200
+
+
+def test_expired_session_is_rejected(
+    client: FlaskClient, login: Callable[[str], TestResponse], database: sqlite3.Connection
+):
+    login("alice")
+    database.execute("UPDATE Sessions SET expires = 0;")
+    database.commit()
+    assert client.get("/profile/alice").status_code == 401
+
+
+def test_forged_session_id_is_rejected(client: FlaskClient):
+    client.set_cookie("session", "A" * 22)
+    assert client.get("/profile/alice").status_code == 401
+    client.set_cookie("session", "not a session id")
+    assert client.get("/profile/alice").status_code == 401
+
+
+def test_expiry_is_extended_without_rewriting_the_session(
+    client: FlaskClient, login: Callable[[str], TestResponse], database: sqlite3.Connection
+):
+    login("alice")
+    # Consume the flashed login message, which changes the session.
+    client.get("/profile/alice")
+    database.execute("UPDATE Sessions SET expires = expires - 1000;")
+    database.commit()
+    before = database.execute("SELECT expires FROM Sessions;").fetchone()[0]
+    response = client.get("/profile/alice")
+    after = database.execute("SELECT expires FROM Sessions;").fetchone()[0]
+    assert after >= before + 1000
+    # The cookie of a non-permanent session is not sent again.
+    assert "Set-Cookie" not in response.headers
+    # Within the refresh interval the expiry time is left alone.
+    client.get("/profile/alice")
+    assert database.execute("SELECT expires FROM Sessions;").fetchone()[0] == after
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import gc
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+from flask import g
+
+from social_insecurity import limiter, sqlite
+from social_insecurity.ratelimit import SQLiteBucketStore
+from social_insecurity.startup import optimize_startup, precompile_templates, prepare_for_fork
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+@pytest.fixture()
+def unfrozen() -> Iterator[None]:
+    yield
+    gc.unfreeze()
+
+
+def test_precompile_templates(app: Flask):
+    app.jinja_env.cache.clear()
+    count = precompile_templates(app)
+    assert count == len(app.jinja_env.list_templates()) > 0
+    assert len(app.jinja_env.cache) == count
+
+
+def test_bytecode_cache(app: Flask, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setitem(app.config, "JINJA_BYTECODE_CACHE_PATH", str(tmp_path / "jinja_cache"))
+    monkeypatch.setattr(app.jinja_env, "bytecode_cache", None)
+    app.jinja_env.cache.clear()
+    optimize_startup(app)
+    assert len(list((tmp_path / "jinja_cache").glob("*.cache"))) == len(app.jinja_env.list_templates())
+
+
+def test_prepare_for_fork(app: Flask, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, unfrozen: None):
+    store = SQLiteBucketStore(tmp_path / "ratelimit.db")
+    monkeypatch.setattr(limiter, "store", store)
+    with app.app_context():
+        sqlite.query("SELECT 1;")
+        assert "flask_sqlite3_connection" in g
+        prepare_for_fork(app)
+        assert "flask_sqlite3_connection" not in g
+    assert store._local.conn is None
+    assert gc.get_freeze_count() > 0
+    # A closed store opens a new connection when it is used again.
+    assert store.take("key", 1.0, 1, 1.0) == 0.0
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from social_insecurity.transfer import TABLES, _drop_deferred, export_rows, import_rows, restore_deferred
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+def dump(database: sqlite3.Connection) -> dict[str, list[tuple]]:
+    return {table: database.execute(f"SELECT * FROM [{table}] ORDER BY rowid;").fetchall() for table in TABLES}
+
+
+def test_export_rows(database: sqlite3.Connection):
+    lines = list(export_rows(database, batch_size=2))
+    records = [json.loads(line) for line in lines]
+    assert [record["table"] for record in records] == [
+        table for table, rows in dump(database).items() for _ in rows
+    ]
+    assert records[1]["row"]["username"] == "alice"
+
+
+def test_export_rows_is_a_snapshot(file_database_path: Path):
+    source = sqlite3.connect(file_database_path)
+    before = dump(source)
+    lines = export_rows(source, batch_size=1)
+    next(lines)
+    writer = sqlite3.connect(file_database_path)
+    writer.execute("INSERT INTO Users (username, first_name, last_name, password) VALUES ('eve', 'Eve', 'Black', '');")
+    writer.execute("INSERT INTO Posts (u_id, content, image) VALUES (last_insert_rowid(), 'new', '');")
+    writer.commit()
+    writer.close()
+    records = [json.loads(line) for line in lines]
+    source.close()
+    assert len(records) + 1 == sum(len(rows) for rows in before.values())
+    assert all(record["row"].get("content") != "new" for record in records)
+
+
+def test_round_trip(database: sqlite3.Connection):
+    before = dump(database)
+    lines = list(export_rows(database))
+    for table in reversed(TABLES):
+        database.execute(f"DELETE FROM [{table}];")
+    database.commit()
+
+    counts = import_rows(database, iter(lines), batch_size=3, transaction_size=5)
+    assert counts == {table: len(rows) for table, rows in before.items()}
+    assert dump(database) == before
+    indexes = {row[0] for row in database.execute("SELECT name FROM sqlite_master WHERE type = 'index';")}
+    assert "Comments_p_id_sort_time" in indexes
+
+
+def test_import_conflict_keeps_indexes(database: sqlite3.Connection):
+    lines = list(export_rows(database))
+    with pytest.raises(sqlite3.IntegrityError):
+        import_rows(database, lines)
+    triggers = {row[0] for row in database.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';")}
+    assert "Comments_insert_version" in triggers
+    assert import_rows(database, lines, on_conflict="ignore")["Users"] == len(dump(database)["Users"])
+
+
+def test_interrupted_import_is_restored(database: sqlite3.Connection):
+    def triggers() -> set[str]:
+        return {row[0] for row in database.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';")}
+
+    before = triggers()
+    # The state a killed import leaves behind.
+    _drop_deferred(database)
+    assert "Comments_insert_version" not in triggers()
+    assert restore_deferred(database) > 0
+    assert triggers() == before
+    assert restore_deferred(database) == 0
+
+    _drop_deferred(database)
+    lines = list(export_rows(database))
+    assert import_rows(database, lines, on_conflict="ignore")["Users"] == len(dump(database)["Users"])
+    assert triggers() == before
+
+
+def test_import_unknown_column(database: sqlite3.Connection):
+    line = json.dumps({"table": "Users", "row": {"id": 99, "is_admin": 1}})
+    with pytest.raises(ValueError, match="Unknown columns"):
+        import_rows(database, [line])
+
+
+def test_export_import_commands(app: Flask, tmp_path: Path):
+    runner = app.test_cli_runner()
+    path = tmp_path / "export.ndjson"
+    result = runner.invoke(args=["export", str(path)])
+    assert result.exit_code == 0
+    result = runner.invoke(args=["import", "--on-conflict", "replace", str(path)])
+    assert result.exit_code == 0
+    assert "Import: Users=5" in result.output
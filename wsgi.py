@@ -0,0 +1,15 @@
+#!/usr/bin/env python
+
+"""Configured as entry point for WSGI servers running the Social Insecurity application.
+
+The application is fully loaded and warmed up at import time. With 'gunicorn --preload' it is
+loaded once in the master process and shared by all workers after fork.
+
+To start the application with gunicorn enter 'gunicorn --preload --workers 4 wsgi:app' in a terminal.
+"""
+
+from social_insecurity import create_app
+from social_insecurity.startup import prepare_for_fork
+
+app = create_app()
+prepare_for_fork(app)